@@ -0,0 +1,3 @@
+# the generator lives in src, so that library modules (e.g. src.batch) do not
+# depend on the benchmarks package
+from src.generator import DegreeDistribution, random_grn, write_qual_sbml  # noqa: F401
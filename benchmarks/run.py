@@ -0,0 +1,199 @@
+"""
+Benchmark the simulation engines over a ladder of random network sizes.
+
+Usage:
+    python -m benchmarks.run --sizes 2 4 8 16 --repeat 3 --out bench.json
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from typing import Callable, Dict, List
+
+from src.generator import random_grn, write_qual_sbml
+
+IMPORTS = ["src.grn", "src.simulator", "src.bool_sim", "src.qual_sbml"]
+
+
+def timeit(func: Callable, repeat: int) -> List[float]:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def load_model(fname: str):
+    """Import a module written by GRN.generate_model and return solve_model"""
+    name = os.path.splitext(os.path.basename(fname))[0]
+    spec = importlib.util.spec_from_file_location(name, fname)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.solve_model
+
+
+def import_times(repeat: int) -> Dict[str, List[float]]:
+    """Cold import time of each src module, measured in a fresh interpreter"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = {}
+    for module in IMPORTS:
+        code = (
+            "import time; t = time.perf_counter(); "
+            f"import {module}; print(time.perf_counter() - t)"
+        )
+        result[module] = [
+            float(
+                subprocess.run(
+                    [sys.executable, "-c", code],
+                    cwd=root,
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                ).stdout.split()[-1]
+            )
+            for _ in range(repeat)
+        ]
+    return result
+
+
+def bench_size(n_species: int, args: argparse.Namespace, workdir: str) -> List[Dict]:
+    import src.simulator as simulator
+    from src.bool_sim import BooleanNetwork
+    from src.qual_sbml import QualModel
+
+    grn = random_grn(
+        n_species,
+        n_inputs=args.inputs,
+        in_degree=args.in_degree,
+        degree_dist=args.degree_dist,
+        logic_types=args.logic_types,
+        seed=args.seed + n_species,
+    )
+    records = []
+
+    def record(engine: str, op: str, func: Callable, repeat=args.repeat):
+        times = timeit(func, repeat)
+        records.append(
+            {
+                "engine": engine,
+                "op": op,
+                "n_species": len(grn.species_names),
+                "n_genes": len(grn.genes),
+                "times": times,
+                "min": min(times),
+                "median": float(np.median(times)),
+            }
+        )
+        print(f"{engine:>6} {op:<18} n={n_species:<5} {min(times):.4f}s")
+
+    # ODE
+    fname = os.path.join(workdir, f"bench_model_{n_species}.py")
+    record("ode", "generate_equations", grn.generate_equations)
+    record("ode", "generate_model", lambda: grn.generate_model(fname))
+    model = load_model(fname)
+
+    IN = np.ones(args.inputs) * 100
+    R0 = np.random.random(n_species)
+    record(
+        "ode",
+        "simulate_single",
+        lambda: simulator.simulate_single(grn, IN, model, plot_on=False, R0=R0),
+    )
+    record(
+        "ode",
+        "get_steady",
+        lambda: simulator.get_steady(grn, model, INS_factor=100),
+    )
+
+    # Boolean
+    bn = BooleanNetwork(grn)
+    state = {s: bool(np.random.randint(2)) for s in grn.species_names}
+    record("bool", "init", lambda: BooleanNetwork(grn))
+    record("bool", "simulate_sync", lambda: bn.simulate(state, "sync", args.steps))
+    record("bool", "simulate_async", lambda: bn.simulate(state, "async", args.steps))
+    if len(grn.species_names) <= args.max_stg:
+        record("bool", "find_attractors", bn.find_attractors)
+
+    # qual SBML
+    sbml = os.path.join(workdir, f"bench_qual_{n_species}.xml")
+    write_qual_sbml(grn, sbml)
+    qual = QualModel(sbml)
+    qual_state = {s: int(v) for s, v in state.items()}
+    record("qual", "step", lambda: qual.step(qual_state))
+    record("qual", "simulate", lambda: qual.simulate(qual_state, args.steps))
+    if len(qual.species) <= args.max_stg:
+        record("qual", "find_attractors", qual.find_attractors)
+
+    return records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2, 4, 8, 16, 32])
+    parser.add_argument("--inputs", type=int, default=2)
+    parser.add_argument("--in-degree", type=int, nargs="+", default=[1, 3])
+    parser.add_argument(
+        "--degree-dist", choices=["fixed", "uniform", "poisson"], default="uniform"
+    )
+    parser.add_argument("--logic-types", nargs="+", default=["and", "or"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--steps", type=int, default=100)
+    parser.add_argument(
+        "--max-stg",
+        type=int,
+        default=10,
+        help="largest network (species incl. inputs) to enumerate attractors on",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-imports", action="store_true")
+    parser.add_argument("--out", default="bench.json")
+    args = parser.parse_args(argv)
+
+    if len(args.in_degree) == 1:
+        args.in_degree = args.in_degree[0]
+
+    records = []
+    if not args.no_imports:
+        for module, times in import_times(args.repeat).items():
+            records.append(
+                {
+                    "engine": "import",
+                    "op": module,
+                    "n_species": 0,
+                    "n_genes": 0,
+                    "times": times,
+                    "min": min(times),
+                    "median": float(np.median(times)),
+                }
+            )
+            print(f"import {module:<18} {min(times):.4f}s")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for n in args.sizes:
+            records.extend(bench_size(n, args, workdir))
+
+    result = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "args": vars(args),
+        },
+        "results": records,
+    }
+
+    with open(args.out, "w") as f:
+        json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""
+Monte Carlo estimation of the attractors of Boolean networks too large for
+the state transition graph.
+
+Many walks are started from uniformly random states and followed with the
+compiled rules of src.bool_eval until they are trapped:
+
+- sync: the successor is deterministic, cycles are detected with Brent's
+  algorithm, vectorized over all walks
+- async: every `check_every` random steps, the states reachable from the
+  current state are enumerated up to `max_closure` states; if they form a
+  closed, strongly connected set, the walk is in that attractor
+
+The fraction of walks ending in each attractor estimates its basin
+probability (the weight of its basin under uniform initial states and, for
+async, uniformly random updates), reported with a Wilson score interval.
+"""
+
+import numpy as np
+from typing import Dict, List, Optional, Tuple, TypedDict
+import src.profiling as profiling
+from src.bool_eval import BooleanEvaluator
+from src.bool_sim import BooleanNetwork, SimulationType
+
+
+class EstimatedAttractor(TypedDict):
+    states: List[Dict[str, bool]]
+    count: int
+    probability: float
+    ci: Tuple[float, float]
+
+
+class AttractorEstimate(TypedDict):
+    steady_states: List[EstimatedAttractor]
+    cyclic_attractors: List[EstimatedAttractor]
+    n_walks: int
+    # walks that were not trapped within max_steps
+    unresolved: int
+
+
+def wilson_interval(count: int, n: int, z: float = 1.96) -> Tuple[float, float]:
+    """Wilson score interval of a binomial proportion"""
+    if n == 0:
+        return (0.0, 1.0)
+    p = count / n
+    center = (p + z**2 / (2 * n)) / (1 + z**2 / n)
+    half = z * np.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / (1 + z**2 / n)
+    return (float(max(center - half, 0.0)), float(min(center + half, 1.0)))
+
+
+def _canonical(states: np.ndarray) -> Tuple[bytes, np.ndarray]:
+    """Key of an attractor and its states, rotated (cycles) or sorted (sets)"""
+    keys = BooleanEvaluator.keys(states)
+    first = min(range(len(keys)), key=keys.__getitem__)
+    return keys[first], np.roll(states, -first, axis=0)
+
+
+def _sync_walks(ev: BooleanEvaluator, X: np.ndarray, max_steps: int, stats):
+    """Brent's cycle detection for every walk, returns (row, cycle states) pairs"""
+    n = len(X)
+    tortoise = X.copy()
+    hare = ev(X)
+    power = np.ones(n, dtype=np.int64)
+    period = np.ones(n, dtype=np.int64)
+    active = np.ones(n, dtype=bool)
+    found = []
+
+    for _ in range(max_steps):
+        met = active & (tortoise == hare).all(axis=1)
+        if met.any():
+            rows = np.flatnonzero(met)
+            active[rows] = False
+            # walk once around the cycle from the meeting point
+            lengths = period[rows]
+            states = [hare[rows]]
+            for _ in range(int(lengths.max()) - 1):
+                states.append(ev(states[-1]))
+            states = np.stack(states, axis=1)
+            for i, row in enumerate(rows):
+                found.append((row, states[i, : lengths[i]]))
+        if not active.any():
+            break
+
+        rows = np.flatnonzero(active)
+        reset = rows[power[rows] == period[rows]]
+        tortoise[reset] = hare[reset]
+        power[reset] *= 2
+        period[reset] = 0
+        hare[rows] = ev(hare[rows])
+        period[rows] += 1
+        if stats is not None:
+            stats.add("walk_steps", len(rows))
+
+    return found
+
+
+def _closure(ev: BooleanEvaluator, x: np.ndarray, max_closure: int):
+    """
+    States reachable from x under async updates, if there are at most
+    max_closure of them and x is reachable from all of them (x is then in a
+    terminal strongly connected component). Otherwise None.
+    """
+    keys = {BooleanEvaluator.keys(x[None, :])[0]: 0}
+    states = [x]
+    edges = []
+    frontier = x[None, :]
+    frontier_ids = np.array([0])
+
+    while len(frontier):
+        parent, Y = ev.async_successors(frontier)
+        new = []
+        for p, key, y in zip(parent, BooleanEvaluator.keys(Y), Y):
+            j = keys.get(key)
+            if j is None:
+                if len(states) == max_closure:
+                    return None
+                j = keys[key] = len(states)
+                states.append(y)
+                new.append(j)
+            edges.append((frontier_ids[p], j))
+        frontier_ids = np.array(new, dtype=np.int64)
+        frontier = np.array([states[j] for j in new]).reshape(-1, len(x))
+
+    # x must be reachable from every state of the closed set
+    predecessors = [[] for _ in states]
+    for a, b in edges:
+        predecessors[b].append(a)
+    seen = np.zeros(len(states), dtype=bool)
+    seen[0] = True
+    stack = [0]
+    while stack:
+        for a in predecessors[stack.pop()]:
+            if not seen[a]:
+                seen[a] = True
+                stack.append(a)
+    return np.array(states) if seen.all() else None
+
+
+def _async_walks(
+    ev: BooleanEvaluator,
+    X: np.ndarray,
+    max_steps: int,
+    check_every: int,
+    max_closure: int,
+    rng: np.random.Generator,
+    stats,
+):
+    found = []
+    # state key -> attractor states, so walks entering known attractors stop early
+    known: Dict[bytes, np.ndarray] = {}
+    active = np.arange(len(X))
+    # failed closure checks back off exponentially, transient states usually
+    # reach more than max_closure states and the check is expensive
+    next_check = np.zeros(len(X), dtype=np.int64)
+    failures = np.zeros(len(X), dtype=np.int64)
+    steps = 0
+
+    while len(active) and steps < max_steps:
+        n_steps = min(check_every, max_steps - steps)
+        for _ in range(n_steps):
+            X[active] = ev.async_step(X[active], rng)
+        steps += n_steps
+        if stats is not None:
+            stats.add("walk_steps", len(active) * n_steps)
+
+        fixed = (ev(X[active]) == X[active]).all(axis=1)
+        trapped = np.zeros(len(active), dtype=bool)
+        for i, (row, key) in enumerate(zip(active, BooleanEvaluator.keys(X[active]))):
+            states = known.get(key)
+            if states is None and fixed[i]:
+                states = X[row][None, :].copy()
+            elif states is None:
+                if steps < next_check[row]:
+                    continue
+                if stats is not None:
+                    stats.add("closure_checks")
+                states = _closure(ev, X[row], max_closure)
+                if states is None:
+                    failures[row] += 1
+                    next_check[row] = steps + check_every * 2 ** failures[row]
+                    continue
+                for k in BooleanEvaluator.keys(states):
+                    known[k] = states
+            found.append((row, states))
+            trapped[i] = True
+        active = active[~trapped]
+
+    return found
+
+
+def _walk_batch(
+    rules: Dict[str, str],
+    mode: SimulationType,
+    n_walks: int,
+    max_steps: int,
+    check_every: int,
+    max_closure: int,
+    seed,
+):
+    """Run n_walks walks, returns {key: [count, states]} and the unresolved count"""
+    rng = np.random.default_rng(seed)
+    ev = BooleanEvaluator(rules)
+    stats = profiling.current()
+
+    X = rng.random((n_walks, ev.n_variables)) < 0.5
+    if mode == "sync":
+        found = _sync_walks(ev, X, max_steps, stats)
+    elif mode == "async":
+        found = _async_walks(ev, X, max_steps, check_every, max_closure, rng, stats)
+    else:
+        raise ValueError("Invalid mode. Must be 'sync' or 'async'")
+
+    attractors = {}
+    for _, states in found:
+        if mode == "async":
+            keys = BooleanEvaluator.keys(states)
+            states = states[sorted(range(len(keys)), key=keys.__getitem__)]
+        key, states = _canonical(states)
+        if key in attractors:
+            attractors[key][0] += 1
+        else:
+            attractors[key] = [1, states]
+    return attractors, n_walks - len(found)
+
+
+def estimate_attractors(
+    bn: BooleanNetwork,
+    mode: SimulationType = "async",
+    n_walks: int = 1000,
+    max_steps: int = 10000,
+    check_every: int = 100,
+    max_closure: int = 1024,
+    batch_size: int = 1000,
+    processes: Optional[int] = None,
+    seed=None,
+) -> AttractorEstimate:
+    """
+    Estimate the attractors of a Boolean network and their basin probabilities
+    from random walks. See BooleanNetwork.estimate_attractors.
+    """
+    sizes = [batch_size] * (n_walks // batch_size)
+    if n_walks % batch_size:
+        sizes.append(n_walks % batch_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    rules = dict(bn.boolean_rules)
+    args = [
+        (rules, mode, size, max_steps, check_every, max_closure, s)
+        for size, s in zip(sizes, seeds)
+    ]
+
+    if processes is None or processes <= 1:
+        results = [_walk_batch(*a) for a in args]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(processes) as pool:
+            results = list(pool.map(_walk_batch, *zip(*args)))
+
+    merged: Dict[bytes, list] = {}
+    unresolved = 0
+    for attractors, missing in results:
+        unresolved += missing
+        for key, (count, states) in attractors.items():
+            if key in merged:
+                merged[key][0] += count
+            else:
+                merged[key] = [count, states]
+
+    variables = list(rules)
+
+    def state_dict(state) -> Dict[str, bool]:
+        return {bn.reverse_names[v]: bool(x) for v, x in zip(variables, state)}
+
+    result: AttractorEstimate = {
+        "steady_states": [],
+        "cyclic_attractors": [],
+        "n_walks": n_walks,
+        "unresolved": unresolved,
+    }
+    for count, states in sorted(merged.values(), key=lambda a: -a[0]):
+        entry: EstimatedAttractor = {
+            "states": [state_dict(s) for s in states],
+            "count": count,
+            "probability": count / n_walks,
+            "ci": wilson_interval(count, n_walks),
+        }
+        if len(states) == 1:
+            result["steady_states"].append(entry)
+        else:
+            result["cyclic_attractors"].append(entry)
+
+    stats = profiling.current()
+    if stats is not None:
+        stats.add("walks", n_walks)
+        stats.add("attractors_found", len(merged))
+
+    return result
@@ -0,0 +1,384 @@
+"""
+Headless batch runner for JSON job specs.
+
+Usage:
+    python -m src.batch jobs.json --out results --format ndjson --workers 4
+
+The job file is a JSON list of jobs, an object {"defaults": {...}, "jobs":
+[...]} whose defaults are merged into every job, a single job object, or
+NDJSON (one job per line).
+A job names a network and an analysis:
+
+    {
+        "id": "toggle",
+        "network": {
+            "species": [{"name": "X1"}, {"name": "A", "delta": 0.1}, ...],
+            "genes": [
+                {
+                    "regulators": [{"name": "X1", "type": "activates", "Kd": 5, "n": 2}],
+                    "products": ["A"],
+                    "alpha": 10,
+                    "logic_type": "and"
+                }
+            ]
+        },
+        "analysis": "steady",
+        "options": {"INS_factor": 100}
+    }
+
+The network is a network_builder definition as above (species without delta
+are inputs), {"random": {...}} with generator.random_grn arguments, or
+{"sbml": "path.xml"} for a qual SBML model, which supports the attractors and
+simulate analyses only. A top-level "sbml" key instead of "network" is
+accepted as well.
+
+Every job writes its result table as one shard in the output directory
+(<id>.ndjson, <id>.parquet or <id>.npy), atomically, and is then recorded in
+_checkpoint.ndjson. A rerun with the same output directory skips the jobs that
+are already done, so interrupted runs resume where they stopped. Results are
+never collected in the parent process.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import traceback
+import numpy as np
+from typing import Callable, Dict, Iterator, List, Optional
+
+CHECKPOINT = "_checkpoint.ndjson"
+FORMATS = {"ndjson": ".ndjson", "parquet": ".parquet", "npy": ".npy"}
+
+
+def read_jobs(filename: str) -> List[dict]:
+    """Jobs of a job file, with defaults merged in and ids assigned"""
+    with open(filename) as f:
+        text = f.read()
+    try:
+        spec = json.loads(text)
+    except json.JSONDecodeError:
+        spec = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    defaults = {}
+    if isinstance(spec, dict) and "jobs" in spec:
+        defaults = spec.get("defaults", {})
+        spec = spec["jobs"]
+    elif isinstance(spec, dict):
+        # a single job, e.g. an NDJSON file with one line
+        spec = [spec]
+
+    jobs = []
+    for i, job in enumerate(spec):
+        job = {**defaults, **job}
+        job.setdefault("id", f"job-{i:06d}")
+        jobs.append(job)
+
+    ids = [job["id"] for job in jobs]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Job ids must be unique")
+    return jobs
+
+
+def build_network(spec: dict):
+    """GRN from a network_builder definition or random_grn arguments"""
+    from src.network_builder import Builder
+
+    if "random" in spec:
+        from src.generator import random_grn
+
+        return random_grn(**spec["random"])
+
+    builder = Builder()
+    species = {}
+    for s in spec["species"]:
+        species[s["name"]] = builder.species(s["name"], s.get("delta"))
+
+    for gene in spec["genes"]:
+        regulators = []
+        for reg in gene["regulators"]:
+            regulator = species[reg["name"]]
+            effect = {
+                "activates": regulator.activates,
+                "represses": regulator.represses,
+            }
+            regulators.append(effect[reg["type"]](reg.get("Kd", 1), reg.get("n", 1)))
+        builder.gene(
+            regulators,
+            [species[name] for name in gene["products"]],
+            alpha=gene.get("alpha", 1),
+            logic_type=gene.get("logic_type", "and"),
+        )
+    return builder.grn
+
+
+def _attractor_frame(attractors: dict, extra: Optional[List[dict]] = None):
+    """One row per attractor state: attractor, kind, state and species columns"""
+    import pandas as pd
+
+    rows = []
+    groups = [("steady", [a]) for a in attractors["steady_states"]] + [
+        ("cyclic", list(a)) for a in attractors["cyclic_attractors"]
+    ]
+    for i, (kind, states) in enumerate(groups):
+        for j, state in enumerate(states):
+            row = {"attractor": i, "kind": kind, "state": j}
+            if extra is not None:
+                row.update(extra[i])
+            row.update({k: int(v) for k, v in state.items()})
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def _steady(grn, options):
+    from src import simulator
+    from src.ode_model import ODEModel
+
+    # in-memory model, parallel workers must not share model.py
+    df = simulator.get_steady(grn, model=ODEModel(grn), **options)
+    df.attrs = {}
+    return df
+
+
+def _simulate(grn, options):
+    import pandas as pd
+    from src import simulator
+    from src.ode_model import ODEModel
+
+    IN = options.pop("IN")
+    T, Y = simulator.simulate_single(
+        grn, IN, model=ODEModel(grn), plot_on=False, **options
+    )
+    df = pd.DataFrame(Y, columns=grn.species_names)
+    df.insert(0, "time", T)
+    return df
+
+
+def _multistable(grn, options):
+    from src import simulator
+    from src.ode_model import ODEModel
+
+    return simulator.get_multistable(grn, model=ODEModel(grn), **options)
+
+
+def _attractors(grn, options):
+    from src.bool_sim import BooleanNetwork
+
+    return _attractor_frame(BooleanNetwork(grn).find_attractors(**options))
+
+
+def _estimate_attractors(grn, options):
+    from src.bool_sim import BooleanNetwork
+
+    estimate = BooleanNetwork(grn).estimate_attractors(**options)
+    found = estimate["steady_states"] + estimate["cyclic_attractors"]
+    attractors = {
+        "steady_states": [a["states"][0] for a in estimate["steady_states"]],
+        "cyclic_attractors": [a["states"] for a in estimate["cyclic_attractors"]],
+    }
+    extra = [
+        {
+            "count": a["count"],
+            "probability": a["probability"],
+            "ci_low": a["ci"][0],
+            "ci_high": a["ci"][1],
+        }
+        for a in found
+    ]
+    return _attractor_frame(attractors, extra)
+
+
+def _screen(grn, options):
+    from src import perturbation
+
+    if "perturbations" in options:
+        # JSON lists of [species, kind] pairs
+        options["perturbations"] = [
+            tuple(tuple(pair) for pair in p) for p in options["perturbations"]
+        ]
+    return perturbation.screen(grn, **options)
+
+
+def _concordance(grn, options):
+    from src import concordance
+
+    return concordance.concordance([("network", grn)], **options)
+
+
+def _qual_attractors(model, options):
+    return _attractor_frame(model.find_attractors(**options))
+
+
+def _qual_simulate(model, options):
+    import pandas as pd
+
+    initial = options.get("initial_state", {s: 0 for s in model.species})
+    trajectory = model.simulate(initial, options.get("steps", 100))
+    df = pd.DataFrame(list(trajectory))
+    df.insert(0, "step", np.arange(len(df)))
+    return df
+
+
+ANALYSES: Dict[str, Callable] = {
+    "steady": _steady,
+    "simulate": _simulate,
+    "multistable": _multistable,
+    "attractors": _attractors,
+    "estimate_attractors": _estimate_attractors,
+    "screen": _screen,
+    "concordance": _concordance,
+}
+QUAL_ANALYSES: Dict[str, Callable] = {
+    "attractors": _qual_attractors,
+    "simulate": _qual_simulate,
+}
+
+
+def write_shard(df, filename: str, format: str) -> None:
+    """Write a result table atomically (write and rename)"""
+    tmp = f"{filename}.{os.getpid()}.tmp"
+    if format == "ndjson":
+        df.to_json(tmp, orient="records", lines=True)
+    elif format == "parquet":
+        # requires pyarrow or fastparquet
+        df.to_parquet(tmp, index=False)
+    elif format == "npy":
+        # structured array, strings (and None) as fixed-width unicode
+        dtypes = {}
+        for c in df.columns:
+            if df[c].dtype.kind in "OSU":
+                df[c] = df[c].fillna("").astype(str)
+                dtypes[c] = f"<U{max(df[c].str.len().max(), 1)}"
+        records = df.to_records(index=False, column_dtypes=dtypes)
+        with open(tmp, "wb") as f:
+            np.save(f, records, allow_pickle=False)
+    else:
+        raise ValueError(f"Invalid format {format}")
+    os.replace(tmp, filename)
+
+
+def run_job(job: dict, out: str, format: str) -> dict:
+    """Run one job and write its shard, returns its checkpoint record"""
+    start = time.perf_counter()
+    record = {"id": job["id"], "analysis": job.get("analysis")}
+    try:
+        options = dict(job.get("options", {}))
+        sbml = job.get("sbml", job.get("network", {}).get("sbml"))
+        if sbml is not None:
+            from src.qual_sbml import QualModel
+
+            target = QualModel(sbml)
+            analysis = QUAL_ANALYSES[job["analysis"]]
+        else:
+            target = build_network(job["network"])
+            analysis = ANALYSES[job["analysis"]]
+
+        df = analysis(target, options)
+        df.insert(0, "job", job["id"])
+        filename = os.path.join(out, job["id"] + FORMATS[format])
+        write_shard(df, filename, format)
+        record.update(status="ok", rows=len(df), shard=os.path.basename(filename))
+    except Exception as e:
+        record.update(
+            status="failed",
+            error=f"{type(e).__name__}: {e}",
+            traceback=traceback.format_exc(),
+        )
+    record["seconds"] = time.perf_counter() - start
+    return record
+
+
+def read_checkpoint(out: str) -> Dict[str, dict]:
+    """Last checkpoint record of every job, a torn last line is ignored"""
+    records = {}
+    path = os.path.join(out, CHECKPOINT)
+    if not os.path.exists(path):
+        return records
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            records[record["id"]] = record
+    return records
+
+
+def run(
+    jobs: List[dict],
+    out: str,
+    format: str = "ndjson",
+    workers: int = 1,
+    retry_failed: bool = False,
+) -> Iterator[dict]:
+    """
+    Run the jobs that are not done yet, yielding checkpoint records as jobs
+    finish. Each record is appended to the checkpoint before it is yielded.
+    """
+    os.makedirs(out, exist_ok=True)
+    done = read_checkpoint(out)
+    skip = {"ok", "failed"} if not retry_failed else {"ok"}
+    todo = [job for job in jobs if done.get(job["id"], {}).get("status") not in skip]
+
+    with open(os.path.join(out, CHECKPOINT), "a") as checkpoint:
+
+        def record(r: dict) -> dict:
+            checkpoint.write(json.dumps(r) + "\n")
+            checkpoint.flush()
+            os.fsync(checkpoint.fileno())
+            return r
+
+        if workers <= 1:
+            for job in todo:
+                yield record(run_job(job, out, format))
+            return
+
+        from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+        with ProcessPoolExecutor(workers) as pool:
+            pending = set()
+            for job in todo:
+                if len(pending) >= 2 * workers:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        yield record(future.result())
+                pending.add(pool.submit(run_job, job, out, format))
+            while pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    yield record(future.result())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("jobs", help="JSON or NDJSON job file")
+    parser.add_argument("--out", default="results", help="output directory")
+    parser.add_argument("--format", choices=list(FORMATS), default="ndjson")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--retry-failed", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.format == "parquet":
+        import pandas as pd
+
+        try:
+            pd.io.parquet.get_engine("auto")
+        except ImportError as e:
+            parser.error(str(e).splitlines()[0])
+
+    jobs = read_jobs(args.jobs)
+    n_done = n_failed = 0
+    for r in run(jobs, args.out, args.format, args.workers, args.retry_failed):
+        if r["status"] == "ok":
+            n_done += 1
+            print(f"{r['id']}: {r['rows']} rows in {r['seconds']:.2f}s")
+        else:
+            n_failed += 1
+            print(f"{r['id']}: {r['error']}", file=sys.stderr)
+    print(f"{n_done} done, {n_failed} failed, {len(jobs)} jobs in total")
+    return 1 if n_failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
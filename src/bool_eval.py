@@ -0,0 +1,195 @@
+import copy
+import re
+import numpy as np
+from typing import Dict, List, Literal
+
+_TOKEN = re.compile(r"\s*([A-Za-z_][A-Za-z0-9_]*|[01]|[()&|!])")
+
+
+def _translate(rule: str, index: Dict[str, int]) -> str:
+    """BNet rule to a numpy expression over the columns of X"""
+    out = []
+    pos = 0
+    rule = rule.strip()
+    while pos < len(rule):
+        match = _TOKEN.match(rule, pos)
+        if match is None:
+            raise ValueError(f"Cannot parse Boolean rule: {rule}")
+        token = match.group(1)
+        pos = match.end()
+        if token in index:
+            out.append(f"X[:, {index[token]}]")
+        elif token == "1":
+            out.append("ONES")
+        elif token == "0":
+            out.append("ZEROS")
+        elif token == "!":
+            out.append("~")
+        elif token in "()&|":
+            out.append(token)
+        else:
+            raise ValueError(f"Unknown variable {token} in rule: {rule}")
+    return " ".join(out)
+
+
+class BooleanEvaluator:
+    """
+    Compiled, vectorized evaluation of Boolean update rules.
+
+    The rules are compiled once into a single numpy function that computes
+    the synchronous successors of a batch of states, a (B, S) boolean array
+    with columns in the order of `variables`.
+
+    Variables can be held at fixed values (knockouts, overexpression) with
+    fix(), which returns a copy sharing the compiled function.
+    """
+
+    def __init__(self, rules: Dict[str, str]):
+        self.variables: List[str] = list(rules)
+        self.index = {v: i for i, v in enumerate(self.variables)}
+
+        lines = [
+            "def update(X):",
+            "    ONES = np.ones(len(X), dtype=bool)",
+            "    ZEROS = np.zeros(len(X), dtype=bool)",
+            "    out = np.empty_like(X)",
+        ]
+        for i, (variable, rule) in enumerate(rules.items()):
+            lines.append(f"    out[:, {i}] = {_translate(rule, self.index)}")
+        lines.append("    return out")
+        self.source = "\n".join(lines)
+
+        namespace = {"np": np}
+        exec(compile(self.source, "<boolean rules>", "exec"), namespace)
+        self._update = namespace["update"]
+
+        self.fixed_index = np.empty(0, dtype=np.int64)
+        self.fixed_value = np.empty(0, dtype=bool)
+
+    def fix(self, values: Dict[str, bool]) -> "BooleanEvaluator":
+        """Copy in which the given variables always update to the given values"""
+        fixed = dict(zip(self.fixed_index.tolist(), self.fixed_value.tolist()))
+        fixed.update({self.index[v]: bool(x) for v, x in values.items()})
+        ev = copy.copy(self)
+        ev.fixed_index = np.array(list(fixed), dtype=np.int64)
+        ev.fixed_value = np.array(list(fixed.values()), dtype=bool)
+        return ev
+
+    @property
+    def n_variables(self) -> int:
+        return len(self.variables)
+
+    def __call__(self, X: np.ndarray) -> np.ndarray:
+        """Synchronous successors of the states X"""
+        out = self._update(np.asarray(X, dtype=bool))
+        if len(self.fixed_index):
+            out[:, self.fixed_index] = self.fixed_value
+        return out
+
+    def async_step(self, X: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """
+        One random asynchronous step per state: one of the variables whose
+        value would change is flipped, states without such variables are
+        fixed points and stay as they are.
+        """
+        X = np.asarray(X, dtype=bool)
+        changing = self(X) != X
+        counts = changing.sum(axis=1)
+        moving = np.flatnonzero(counts)
+        if len(moving) == 0:
+            return X.copy()
+
+        # pick the k-th changing variable with k uniform in [0, count)
+        k = (rng.random(len(moving)) * counts[moving]).astype(np.int64)
+        position = np.argmax(np.cumsum(changing[moving], axis=1) > k[:, None], axis=1)
+
+        Y = X.copy()
+        Y[moving, position] = ~Y[moving, position]
+        return Y
+
+    def async_successors(self, X: np.ndarray):
+        """
+        All asynchronous successors of a batch of states.
+
+        Returns (parent, Y): Y[i] is a successor of X[parent[i]].
+        """
+        X = np.asarray(X, dtype=bool)
+        parent, variable = np.nonzero(self(X) != X)
+        Y = X[parent]
+        Y[np.arange(len(parent)), variable] ^= True
+        return parent, Y
+
+    @staticmethod
+    def keys(X: np.ndarray) -> List[bytes]:
+        """Hashable key of every state"""
+        packed = np.ascontiguousarray(np.packbits(np.asarray(X, dtype=bool), axis=-1))
+        return packed.view(f"V{packed.shape[-1]}")[..., 0].tolist()
+
+    def states(self, max_variables: int = 20):
+        """
+        Every state with the fixed variables at their values. Returns the free
+        variables and the states, the i-th state has the bits of i as values
+        of the free variables.
+        """
+        free = np.setdiff1d(np.arange(self.n_variables), self.fixed_index)
+        F = len(free)
+        if F > max_variables:
+            raise ValueError(
+                f"{F} free variables, the state transition graph is too large"
+            )
+
+        codes = np.arange(2**F, dtype=np.int64)
+        X = np.zeros((len(codes), self.n_variables), dtype=bool)
+        X[:, free] = (codes[:, None] >> np.arange(F)) & 1
+        X[:, self.fixed_index] = self.fixed_value
+        return free, X
+
+    def fixed_points(self, max_variables: int = 20) -> np.ndarray:
+        """All steady states (the same for sync and async updates)"""
+        _, X = self.states(max_variables)
+        return X[(self(X) == X).all(axis=1)]
+
+    def attractors(
+        self, mode: Literal["async", "sync"] = "async", max_variables: int = 20
+    ) -> List[np.ndarray]:
+        """
+        All attractors, by enumerating the state transition graph over the
+        free (not fixed) variables and finding its terminal strongly connected
+        components. Every attractor is an array of states, in cycle order for
+        sync and sorted otherwise.
+        """
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import connected_components
+
+        free, X = self.states(max_variables)
+        F = len(free)
+        codes = np.arange(len(X), dtype=np.int64)
+        weights = np.int64(1) << np.arange(F, dtype=np.int64)
+
+        if mode == "sync":
+            src = codes
+            dst = self(X)[:, free].astype(np.int64) @ weights
+        elif mode == "async":
+            src, Y = self.async_successors(X)
+            dst = Y[:, free].astype(np.int64) @ weights
+        else:
+            raise ValueError("Invalid mode. Must be 'sync' or 'async'")
+
+        graph = coo_matrix(
+            (np.ones(len(src), dtype=np.int8), (src, dst)), shape=(len(codes),) * 2
+        )
+        n, labels = connected_components(graph, directed=True, connection="strong")
+        leaving = labels[src] != labels[dst]
+        terminal = np.setdiff1d(np.arange(n), labels[src[leaving]])
+
+        result = []
+        for c in terminal:
+            members = np.flatnonzero(labels == c)
+            if mode == "sync" and len(members) > 1:
+                # follow the cycle from its smallest state
+                order = [members[0]]
+                while len(order) < len(members):
+                    order.append(dst[order[-1]])
+                members = np.array(order)
+            result.append(X[members])
+        return result
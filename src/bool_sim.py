@@ -1,13 +1,14 @@
 import numpy as np
-from typing import Dict, List, Literal
-import pyboolnet.attractors
-import pyboolnet.file_exchange
-import pyboolnet.interaction_graphs
-import pyboolnet.state_transition_graphs
+from typing import Dict, List, Literal, Optional
 import src.grn as grn
-import networkx as nx
 from typing import TypedDict
 import src.utils as utils
+import src.profiling as profiling
+import src.cache as cache
+from src.trajectory import Trajectory, encoder, simulate_deterministic
+
+# pyboolnet and networkx are imported inside the methods that need them,
+# importing this module only pulls in numpy
 
 
 class Attractors(TypedDict):
@@ -31,6 +32,11 @@ class BooleanNetwork:
         # simple LUT
         self.reverse_names = {v: k for k, v in self.original_names.items()}
         self.boolean_rules = self._generate_boolean_rules()
+        self._primes_cache = None
+        # stats of the last instrumented call, see src.profiling
+        self.last_stats = None
+        # keep the rules in sync with changes made through the GRN methods
+        grn.subscribe(self._on_change)
 
     def _generate_boolean_rules(self) -> Dict[str, str]:
         """
@@ -41,51 +47,83 @@ class BooleanNetwork:
             {species_name: "expression"} where expression is a Boolean expression.
             {'X1': 'X1', 'X2': 'X2', 'var_Y': '((X2) & (!X1)) | ((X1) & (!X2))'}
         """
-        rules = {}
-
-        for species in self.grn.species_names:
-            rules[self.original_names[species]] = []
-
-        for gene in self.grn.genes:
-            products = [self.original_names[p["name"]] for p in gene["products"]]
-            activators = []
-            inhibitors = []
-
-            # separate activators and inhibitors
-            for reg in gene["regulators"]:
-                reg_name = self.original_names[reg["name"]]
-                if reg["type"] == 1:
-                    activators.append(reg_name)
-                else:
-                    inhibitors.append(reg_name)
-
-            # possible: 'and', 'or', ''
-            if gene["logic_type"] == "and":
-                act_expr = " & ".join(activators) if activators else "1"
-                inh_expr = (
-                    " & ".join([f"!{inh}" for inh in inhibitors]) if inhibitors else "1"
-                )
-                expr = f"({act_expr}) & ({inh_expr})"
-            elif gene["logic_type"] == "or":
-                terms = []
-                if activators:
-                    terms.append(" | ".join(activators))
-                terms.extend([f"!{inh}" for inh in inhibitors])
-                expr = f"({' | '.join(terms)})"
-
-            for product in products:
-                rules[product].append(expr)
-
-        # combine rules
-        final_rules = {}
-        for species, expressions in rules.items():
-            if expressions:
-                final_rules[species] = " | ".join([f"({expr})" for expr in expressions])
+        index = self.grn.index
+        names = [self.original_names[s] for s in index.species_names]
+
+        # expression of every gene and the genes producing each species
+        self._gene_expressions = [
+            self._gene_expression(g) for g in range(index.n_genes)
+        ]
+        self._producers = {name: [] for name in names}
+        for p, g in zip(index.prod_species, index.prod_gene):
+            self._producers[names[p]].append(int(g))
+
+        return {name: self._combine_rule(name) for name in names}
+
+    def _combine_rule(self, species: str) -> str:
+        """Rule of a (renamed) species: OR of the genes producing it"""
+        expressions = [self._gene_expressions[g] for g in self._producers[species]]
+        if expressions:
+            return " | ".join([f"({expr})" for expr in expressions])
+        # input species or no regulators
+        return species
+
+    def _on_change(self, event: grn.GRNEvent) -> None:
+        """Patch the rules of the species affected by a change to the GRN"""
+        kind = event["kind"]
+
+        if kind == "species_added":
+            name = event["species"][0]
+            renamed = f"var_{name}" if len(name) < 2 else name
+            self.original_names[name] = renamed
+            self.reverse_names[renamed] = name
+            self._producers[renamed] = []
+            self.boolean_rules[renamed] = renamed
+        elif not {"logic_type", "type", "regulators", "products"} & set(
+            event["fields"]
+        ):
+            # Kd, n, alpha and delta do not change the Boolean abstraction
+            return
+        else:
+            gene = event["gene"]
+            expr = self._gene_expression(gene)
+            if kind == "gene_added":
+                self._gene_expressions.append(expr)
+                for name in event["species"]:
+                    self._producers[self.original_names[name]].append(gene)
             else:
-                # input species or no regulators
-                final_rules[species] = species
+                self._gene_expressions[gene] = expr
+
+            for name in event["species"]:
+                renamed = self.original_names[name]
+                self.boolean_rules[renamed] = self._combine_rule(renamed)
 
-        return final_rules
+        self._primes_cache = None
+
+    def _gene_expression(self, gene: int) -> str:
+        """Boolean expression for the activity of one gene, by gene index"""
+        activators = []
+        inhibitors = []
+
+        # separate activators and inhibitors
+        for reg in self.grn.genes[gene]["regulators"]:
+            reg_name = self.original_names[reg["name"]]
+            if reg["type"] == 1:
+                activators.append(reg_name)
+            else:
+                inhibitors.append(reg_name)
+
+        # possible: 'and', 'or', '' (single regulator, same as 'and')
+        if self.grn.genes[gene]["logic_type"] == "or":
+            terms = []
+            if activators:
+                terms.append(" | ".join(activators))
+            terms.extend([f"!{inh}" for inh in inhibitors])
+            return f"({' | '.join(terms) if terms else '1'})"
+
+        act_expr = " & ".join(activators) if activators else "1"
+        inh_expr = " & ".join([f"!{inh}" for inh in inhibitors]) if inhibitors else "1"
+        return f"({act_expr}) & ({inh_expr})"
 
     def print_rules(self):
         print("Boolean rules:")
@@ -100,6 +138,20 @@ class BooleanNetwork:
             bnet_lines.append(f"{species}, {rule}")
         return "\n".join(bnet_lines)
 
+    def _primes(self) -> dict:
+        """
+        Convert the Boolean rules to PyBoolNet primes, cached until the GRN changes.
+        Callers must not modify the returned primes.
+        """
+        import pyboolnet.file_exchange
+
+        if self._primes_cache is None:
+            with profiling.timer(profiling.current(), "primes"):
+                self._primes_cache = pyboolnet.file_exchange.bnet_text2primes(
+                    self._rules_to_bnet_text()
+                )
+        return self._primes_cache
+
     def get_boolean_rules(self) -> Dict[str, str]:
         """Return the generated Boolean rules with original variable names"""
         original_rules = {}
@@ -111,12 +163,13 @@ class BooleanNetwork:
             original_rules[original_name] = rule_original
         return original_rules
 
+    @profiling.instrumented
     def simulate(
         self,
         initial_state: Dict[str, bool],
         mode: SimulationType = "async",
         steps: int = 100,
-    ) -> List[Dict[str, bool]]:
+    ) -> Trajectory:
         """
         Simulate asynchronous Boolean network dynamics
 
@@ -125,7 +178,10 @@ class BooleanNetwork:
             steps: Number of simulation steps
 
         Returns:
-            List of states (dictionaries) representing the trajectory
+            Trajectory, a list-like sequence of states (dictionaries). In sync
+            mode the simulation stops at the first repeated state and the
+            trajectory stores only the transient and one period of the cycle,
+            it still has steps + 1 states and expands on demand.
         """
         assert mode in ["async", "sync"], "Invalid simulation type"
 
@@ -134,67 +190,85 @@ class BooleanNetwork:
             self.original_names[k]: v for k, v in initial_state.items()
         }
 
-        # Convert rules to BNet format text
-        bnet_text = self._rules_to_bnet_text()
+        import pyboolnet.state_transition_graphs
 
         # Convert to PyBoolNet primes
-        primes = pyboolnet.file_exchange.bnet_text2primes(bnet_text)
+        primes = self._primes()
+
+        stats = profiling.current()
+        successor_synchronous = profiling.timed(
+            pyboolnet.state_transition_graphs.successor_synchronous, stats, "successors"
+        )
+        successors_asynchronous = profiling.timed(
+            pyboolnet.state_transition_graphs.successors_asynchronous,
+            stats,
+            "successors",
+        )
+
+        def original(state):
+            return {self.reverse_names[k]: v for k, v in state.items()}
+
+        if mode == "sync":
+            # deterministic: stop once the trajectory enters its cycle
+            renamed = simulate_deterministic(
+                lambda state: successor_synchronous(primes, state),
+                renamed_initial_state,
+                steps,
+                encoder(list(self.boolean_rules)),
+            )
+            trajectory = Trajectory(
+                [original(state) for state in renamed.transient],
+                [original(state) for state in renamed.cycle],
+                renamed.length,
+            )
+            if stats is not None:
+                stats.add(
+                    "states_visited", len(trajectory.transient) + trajectory.period
+                )
+            return trajectory
 
         # Initialize trajectory
-        trajectory = []
+        states = []
         current_state = renamed_initial_state.copy()
 
         # Add initial state with original names
-        trajectory.append({self.reverse_names[k]: v for k, v in current_state.items()})
+        states.append(original(current_state))
 
         for _ in range(steps):
             # Get possible successor states
-
-            if mode == "sync":
-                successors = pyboolnet.state_transition_graphs.successor_synchronous(
-                    primes, current_state
-                )
-            else:
-                successors = pyboolnet.state_transition_graphs.successors_asynchronous(
-                    primes, current_state
-                )
+            successors = successors_asynchronous(primes, current_state)
 
             if not successors:
                 break
 
-            if mode == "sync":
-                next_state = successors
-
-            else:
-                successor_dicts = []
-                for state in successors:
-                    successor_dicts.append(state)
-
-                if not successor_dicts:
-                    break
-
-                # Most basic asynchronous update: randomly choose one of the possible states
-                next_state = successor_dicts[np.random.randint(len(successor_dicts))]
+            # Most basic asynchronous update: randomly choose one of the possible states
+            next_state = successors[np.random.randint(len(successors))]
 
             # Convert state back to original names for trajectory
-            trajectory.append({self.reverse_names[k]: v for k, v in next_state.items()})
+            states.append(original(next_state))
             current_state = next_state.copy()
 
-        return trajectory
+        if stats is not None:
+            stats.add("states_visited", len(states))
 
-    def plot_state_transitions(self, ax=None):
-        primes = pyboolnet.file_exchange.bnet_text2primes(self._rules_to_bnet_text())
-        G = pyboolnet.state_transition_graphs.primes2stg(primes, "synchronous")
+        return Trajectory(states, [], len(states))
 
-        def node_name(state: Dict[str, bool]) -> str:
-            return "".join(f"{int(state[s])}" for s in self.grn.species_names)
+    def plot_state_transitions(self, ax=None, **kwargs):
+        """
+        Plot the synchronous state transition graph. Its attractors (terminal
+        SCCs) are highlighted, these can differ from the asynchronous
+        attractors returned by find_attractors.
+        """
+        import pyboolnet.state_transition_graphs
 
-        attractors = self.find_attractors()
-        utils.plot_state_transitions(G, attractors, node_name, ax)
+        G = pyboolnet.state_transition_graphs.primes2stg(self._primes(), "synchronous")
+        utils.plot_state_transitions(G, ax=ax, **kwargs)
 
     def plot_interaction_graph(self, ax=None):
-        primes = pyboolnet.file_exchange.bnet_text2primes(self._rules_to_bnet_text())
-        G = pyboolnet.interaction_graphs.primes2igraph(primes)
+        import networkx as nx
+        import pyboolnet.interaction_graphs
+
+        G = pyboolnet.interaction_graphs.primes2igraph(self._primes())
 
         edges = [(self.reverse_names[e[0]], self.reverse_names[e[1]]) for e in G.edges]
         G = nx.DiGraph()
@@ -202,20 +276,34 @@ class BooleanNetwork:
 
         utils.plot_interaction_graph(G, ax)
 
+    @profiling.instrumented
     def find_attractors(self) -> Attractors:
         """
-        Find all attractors in the Boolean network using Tarjan's algorithm
+        Find all attractors in the Boolean network using Tarjan's algorithm.
+        Results are cached on the network structure when src.cache is enabled.
         """
-        bnet_text = self._rules_to_bnet_text()
-        primes = pyboolnet.file_exchange.bnet_text2primes(bnet_text)
+        return cache.cached("attractors", self.grn, self._find_attractors, False)
+
+    def _find_attractors(self) -> Attractors:
+        import pyboolnet.attractors
+        import pyboolnet.state_transition_graphs
+
+        primes = self._primes()
+
+        stats = profiling.current()
 
         # state transition graph
-        stg = pyboolnet.state_transition_graphs.primes2stg(primes, "asynchronous")
+        with profiling.timer(stats, "stg"):
+            stg = pyboolnet.state_transition_graphs.primes2stg(primes, "asynchronous")
 
         # if using just compute_attractors, you need ASP solvers like clingo
-        steady_states, cyclic_attractors = (
-            pyboolnet.attractors.compute_attractors_tarjan(stg)
-        )
+        with profiling.timer(stats, "tarjan"):
+            steady_states, cyclic_attractors = (
+                pyboolnet.attractors.compute_attractors_tarjan(stg)
+            )
+
+        if stats is not None:
+            stats.add("states_visited", stg.number_of_nodes())
 
         def state_str_to_dict(state_str: str) -> Dict[str, bool]:
             """
@@ -241,3 +329,49 @@ class BooleanNetwork:
             result["cyclic_attractors"].append(cyclic_attractor)
 
         return result
+
+    @profiling.instrumented
+    def estimate_attractors(
+        self,
+        mode: SimulationType = "async",
+        n_walks: int = 1000,
+        max_steps: int = 10000,
+        check_every: int = 100,
+        max_closure: int = 1024,
+        batch_size: int = 1000,
+        processes: Optional[int] = None,
+        seed=None,
+    ):
+        """
+        Estimate the attractors from random walks, for networks too large for
+        find_attractors. See src.attractor_sampling.
+
+        Args:
+            mode: "async" (random single-variable updates) or "sync"
+            n_walks: number of walks from uniformly random initial states
+            max_steps: walks not trapped after this many steps are unresolved
+            check_every: async steps between trap checks
+            max_closure: largest reachable set enumerated in a trap check,
+                async attractors with more states are not detected
+            batch_size: walks simulated together in one batch
+            processes: run batches in a process pool of this size
+            seed: seed for the random generator
+
+        Returns:
+            AttractorEstimate: steady states and cyclic attractors, each with
+            its states, number of walks, basin probability and 95% confidence
+            interval, plus the number of unresolved walks
+        """
+        from src.attractor_sampling import estimate_attractors
+
+        return estimate_attractors(
+            self,
+            mode=mode,
+            n_walks=n_walks,
+            max_steps=max_steps,
+            check_every=check_every,
+            max_closure=max_closure,
+            batch_size=batch_size,
+            processes=processes,
+            seed=seed,
+        )
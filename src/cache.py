@@ -0,0 +1,253 @@
+"""
+Persistent, content-addressed cache of analysis results.
+
+Results are keyed on a canonical hash of the GRN (its structure and, where
+they matter, its parameters) and the options of the analysis, so a result
+computed once is reused by any later process analysing the same network.
+The cache is off by default and is switched on globally:
+
+    from src import cache
+
+    cache.enable()  # ~/.cache/grenmlin, or $GRENMLIN_CACHE
+    bool_network.find_attractors()  # computed and stored
+    bool_network.find_attractors()  # read from disk
+
+Entries are zlib-compressed pickles, written atomically, one file per
+result. When the directory grows beyond max_bytes the least recently used
+entries are evicted.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import zlib
+from pathlib import Path
+from typing import Callable, Optional
+import numpy as np
+import src.profiling as profiling
+
+_MAGIC = b"GRNC1"
+_cache: Optional["ResultCache"] = None
+
+
+def grn_hash(grn, parameters: bool = True) -> str:
+    """
+    Canonical hash of a GRN, computed from GRN.index so that it does not
+    depend on how the network was built. With parameters=False only the
+    structure (species, inputs, regulation signs, logic types and products)
+    is hashed, which is all the Boolean abstraction depends on.
+
+    The index is rebuilt from the live species and gene dicts first, so that
+    direct edits (grn.genes[0]["alpha"] = 50) change the hash, and the
+    analysis run on a miss sees the same values as the key.
+    """
+    index = grn.reindex()
+    h = hashlib.sha256()
+
+    def add(name, value):
+        h.update(name.encode())
+        if isinstance(value, np.ndarray):
+            h.update(str(value.dtype).encode())
+            h.update(str(value.shape).encode())
+            h.update(np.ascontiguousarray(value).tobytes())
+        else:
+            h.update("\0".join(value).encode())
+            h.update(b"\1")
+
+    add("species", index.species_names)
+    add("inputs", list(grn.input_species_names))
+    add("logic_type", index.logic_type)
+    add("reg_ptr", index.reg_ptr)
+    add("reg_species", index.reg_species)
+    add("reg_type", index.reg_type)
+    add("prod_ptr", index.prod_ptr)
+    add("prod_species", index.prod_species)
+    if parameters:
+        add("delta", index.delta)
+        add("alpha", index.alpha)
+        add("reg_Kd", index.reg_Kd)
+        add("reg_n", index.reg_n)
+    return h.hexdigest()
+
+
+def _options_hash(options: dict) -> str:
+    def encode(value):
+        if isinstance(value, np.ndarray):
+            return value.tolist()
+        if isinstance(value, np.generic):
+            return value.item()
+        raise TypeError(f"Cannot hash option value {value!r}")
+
+    text = json.dumps(options, sort_keys=True, default=encode)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Directory of cached results.
+
+    Parameters:
+    directory: where entries are stored, $GRENMLIN_CACHE or ~/.cache/grenmlin
+        by default
+    max_bytes: total size above which least recently used entries are evicted
+    """
+
+    def __init__(self, directory=None, max_bytes: int = 1 << 30):
+        if directory is None:
+            directory = os.environ.get(
+                "GRENMLIN_CACHE", Path.home() / ".cache" / "grenmlin"
+            )
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        # running total of the directory size, scanned on first write and
+        # refreshed by every eviction
+        self._total: Optional[int] = None
+
+    def key(self, kind: str, grn, parameters: bool = True, **options) -> str:
+        """
+        Key of the result of analysis `kind` of grn with the given options.
+        The GRN hash comes first so that invalidate can find all its entries.
+        """
+        return f"{grn_hash(grn, parameters)}-{kind}-{_options_hash(options)[:32]}"
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.bin"
+
+    def get(self, key: str, default=None):
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return default
+        if not data.startswith(_MAGIC):
+            return default
+        # mark as recently used for the LRU eviction
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # evicted by another process since it was read
+            pass
+        try:
+            return pickle.loads(zlib.decompress(data[len(_MAGIC) :]))
+        except (zlib.error, pickle.UnpicklingError, EOFError):
+            # corrupt entry, drop it so that it is recomputed
+            path.unlink(missing_ok=True)
+            self._total = None
+            return default
+
+    def put(self, key: str, value) -> None:
+        data = _MAGIC + zlib.compress(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        path = self._path(key)
+        if self._total is None:
+            self._total = self.size()
+        try:
+            self._total -= path.stat().st_size
+        except FileNotFoundError:
+            pass
+        # write and rename, so concurrent readers never see partial entries
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        self._total += len(data)
+        # the directory is only scanned once the tracked size crosses max_bytes
+        if self._total > self.max_bytes:
+            self.evict()
+
+    def entries(self):
+        """(path, size, last use) of every entry, least recently used first"""
+        entries = []
+        for path in self.directory.glob("*.bin"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((path, st.st_size, st.st_mtime))
+        return sorted(entries, key=lambda e: e[2])
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, max_bytes: Optional[int] = None) -> int:
+        """Remove least recently used entries until under max_bytes"""
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for path, size, _ in entries:
+            if total <= max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        self._total = total
+        return removed
+
+    def invalidate(self, grn=None, kind: Optional[str] = None) -> int:
+        """
+        Remove the entries of grn (all of them when None), optionally only
+        those of one kind of analysis. Returns the number removed.
+        """
+        if grn is None:
+            prefixes = [""]
+        else:
+            prefixes = [grn_hash(grn, True) + "-", grn_hash(grn, False) + "-"]
+
+        removed = 0
+        for path, _, _ in self.entries():
+            name = path.stem
+            if not any(name.startswith(p) for p in prefixes):
+                continue
+            if kind is not None and name.split("-")[1] != kind:
+                continue
+            path.unlink(missing_ok=True)
+            removed += 1
+        self._total = None
+        return removed
+
+    def clear(self) -> int:
+        return self.invalidate()
+
+
+def enable(directory=None, max_bytes: int = 1 << 30) -> ResultCache:
+    """Cache results of the supported analyses in directory"""
+    global _cache
+    _cache = ResultCache(directory, max_bytes)
+    return _cache
+
+
+def disable() -> None:
+    global _cache
+    _cache = None
+
+
+def active() -> Optional[ResultCache]:
+    """The enabled cache, None when caching is off"""
+    return _cache
+
+
+def cached(kind: str, grn, compute: Callable, parameters: bool = True, **options):
+    """
+    Return the cached result of compute() for (kind, grn, options), computing
+    and storing it on a miss. Calls compute() directly when caching is off.
+    """
+    cache = _cache
+    if cache is None:
+        return compute()
+
+    stats = profiling.current()
+    key = cache.key(kind, grn, parameters, **options)
+    missing = object()
+    value = cache.get(key, missing)
+    if value is not missing:
+        if stats is not None:
+            stats.add("cache_hits")
+        return value
+
+    if stats is not None:
+        stats.add("cache_misses")
+    value = compute()
+    cache.put(key, value)
+    return value
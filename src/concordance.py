@@ -0,0 +1,229 @@
+"""
+Concordance of the Boolean abstraction with the ODE model over many GRNs.
+
+For every network and every binary input combination:
+
+- the Boolean steady states are the fixed points of the Boolean rules with
+  the inputs held at the combination (BooleanEvaluator.fixed_points)
+- the ODE steady states are relaxed from n_starts random initial states with
+  the inputs at combination * INS_factor, binarized with a threshold per
+  species and deduplicated; starts that have not converged within max_time
+  (e.g. oscillations) are left out and counted in n_unconverged
+
+and the two sets of binary states of the regulated species are compared.
+Networks are evaluated in a process pool and results are yielded as soon as
+each network is done.
+"""
+
+import numpy as np
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+import src.profiling as profiling
+from src.bool_eval import BooleanEvaluator
+from src.grn import GRN
+from src.hill import HillTerms
+from src.simulator import BatchRHS, steady_batch
+
+Threshold = Union[float, Dict[str, float], str]
+
+COLUMNS = [
+    "network",
+    "input",
+    "n_boolean",
+    "n_ode",
+    "n_common",
+    "match",
+    "jaccard",
+    "precision",
+    "recall",
+    "hamming",
+    "n_unconverged",
+    "error",
+]
+
+
+def thresholds(grn: GRN, threshold: Threshold = "kd") -> np.ndarray:
+    """
+    Binarization threshold of every species. A number is used for all
+    species, a dict per species name. "kd" uses the mean Kd with which a
+    species regulates its targets, and the median Kd of the network for
+    species that regulate nothing.
+    """
+    index = grn.index
+    if isinstance(threshold, dict):
+        return np.array([threshold[name] for name in index.species_names], dtype=float)
+    if threshold != "kd":
+        return np.full(index.n_species, float(threshold))
+
+    total = np.bincount(index.reg_species, index.reg_Kd, index.n_species)
+    count = np.bincount(index.reg_species, minlength=index.n_species)
+    default = float(np.median(index.reg_Kd)) if len(index.reg_Kd) else 1.0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count > 0, total / count, default)
+
+
+def _unique_rows(X: np.ndarray) -> np.ndarray:
+    return np.unique(X, axis=0) if len(X) else X
+
+
+def compare(boolean: np.ndarray, ode: np.ndarray) -> dict:
+    """Concordance metrics of two sets of binary states (rows)"""
+    B = {row.tobytes() for row in np.asarray(boolean, dtype=bool)}
+    O = {row.tobytes() for row in np.asarray(ode, dtype=bool)}
+    common = len(B & O)
+    union = len(B | O)
+
+    # distance of every ODE state to the closest Boolean steady state
+    if len(boolean) and len(ode):
+        distance = (ode[:, None, :] != boolean[None, :, :]).mean(axis=-1)
+        hamming = float(distance.min(axis=1).mean())
+    else:
+        hamming = float("nan")
+
+    return {
+        "n_boolean": len(B),
+        "n_ode": len(O),
+        "n_common": common,
+        "match": B == O,
+        "jaccard": common / union if union else 1.0,
+        "precision": common / len(B) if B else float("nan"),
+        "recall": common / len(O) if O else float("nan"),
+        "hamming": hamming,
+    }
+
+
+def _evaluate(
+    name: str,
+    grn: GRN,
+    INS_factor: float,
+    threshold: Threshold,
+    n_starts: int,
+    eps: float,
+    max_time: float,
+    max_variables: int,
+    seed,
+) -> List[dict]:
+    """Concordance rows of one network, one per input combination"""
+    from src.bool_sim import BooleanNetwork
+    from src.simulator import generate_bin_vectors
+
+    rng = np.random.default_rng(seed)
+    stats = profiling.current()
+    try:
+        bn = BooleanNetwork(grn)
+        ev = BooleanEvaluator(bn.boolean_rules)
+        hill = HillTerms(grn)
+        cut = thresholds(grn, threshold)
+        # inputs are given, only the regulated species are compared
+        regulated = ~grn.index.is_input
+
+        inputs = [bn.original_names[s] for s in grn.input_species_names]
+        n_INS = len(inputs)
+        n_RS = len(grn.species_names) - n_INS
+        model = BatchRHS(hill, np.empty(0, dtype=np.int64), n_starts)
+
+        rows = []
+        for combination in generate_bin_vectors(n_INS):
+            fixed = ev.fix(dict(zip(inputs, combination.astype(bool))))
+            boolean = fixed.fixed_points(max_variables)[:, regulated]
+
+            S0 = np.column_stack(
+                [
+                    np.tile(combination * INS_factor, (n_starts, 1)),
+                    rng.random((n_starts, n_RS)),
+                ]
+            )
+            states, converged = steady_batch(model, S0, eps, max_time)
+            ode = _unique_rows((states[converged] > cut)[:, regulated])
+            n_unconverged = int((~converged).sum())
+
+            row = {"network": name, "input": "".join(map(str, combination))}
+            row.update(compare(boolean, ode))
+            row["n_unconverged"] = n_unconverged
+            row["error"] = (
+                f"{n_unconverged} of {n_starts} starts did not converge "
+                f"within {max_time}"
+                if n_unconverged
+                else None
+            )
+            rows.append(row)
+            if stats is not None:
+                stats.add("input_combinations")
+        return rows
+    except Exception as e:
+        # one failing network must not stop an overnight run
+        return [{"network": name, "error": f"{type(e).__name__}: {e}"}]
+
+
+def _named(grns) -> Iterator[Tuple[str, GRN]]:
+    if isinstance(grns, dict):
+        yield from grns.items()
+        return
+    for i, item in enumerate(grns):
+        yield item if isinstance(item, tuple) else (str(i), item)
+
+
+def iter_concordance(
+    grns: Union[Iterable[GRN], Iterable[Tuple[str, GRN]], Dict[str, GRN]],
+    INS_factor: float = 100,
+    threshold: Threshold = "kd",
+    n_starts: int = 10,
+    eps: float = 10 ** (-3),
+    max_time: float = 1000,
+    max_variables: int = 20,
+    processes: Optional[int] = None,
+    seed=None,
+) -> Iterator[List[dict]]:
+    """
+    Evaluate the concordance of every network and yield its rows (one per
+    input combination) as soon as it is done, in completion order.
+
+    Parameters:
+    grns: networks, as GRNs (named by position), (name, GRN) pairs or a dict;
+        may be a generator, it is consumed as the workers become free
+    INS_factor: ODE level of the inputs that are on
+    threshold: binarization threshold, see thresholds()
+    n_starts: random initial states of the ODE steady-state search
+    eps: convergence threshold of the ODE steady states
+    max_time: longest integration of the ODE steady states, so that
+        oscillating networks cannot block a worker
+    max_variables: largest number of regulated species for the Boolean
+        fixed-point enumeration
+    processes: evaluate networks in a process pool of this size
+    seed: seed for the random initial states
+    """
+    named = _named(grns)
+    seeds = np.random.SeedSequence(seed)
+    options = (INS_factor, threshold, n_starts, eps, max_time, max_variables)
+
+    if processes is None or processes <= 1:
+        for name, grn in named:
+            yield _evaluate(name, grn, *options, seeds.spawn(1)[0])
+        return
+
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+    with ProcessPoolExecutor(processes) as pool:
+        pending = set()
+        for name, grn in named:
+            # bounded number of networks in flight
+            if len(pending) >= 2 * processes:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(pool.submit(_evaluate, name, grn, *options, seeds.spawn(1)[0]))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+@profiling.instrumented
+def concordance(grns, **kwargs):
+    """
+    Concordance of all networks as a DataFrame, one row per network and input
+    combination. See iter_concordance for the parameters.
+    """
+    import pandas as pd
+
+    rows = [row for rows in iter_concordance(grns, **kwargs) for row in rows]
+    return pd.DataFrame(rows, columns=COLUMNS)
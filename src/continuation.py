@@ -0,0 +1,300 @@
+"""
+Dose-response scans of steady states over the level of one input species.
+
+Instead of relaxing from random initial conditions at every input level
+(as simulator.get_steady does), each steady state is found with Newton's
+method warm-started from the solution at the neighbouring level. Two modes
+are available:
+
+- natural-parameter continuation, sweeping the levels up and then down, which
+  exposes hysteresis as the interval where both sweeps disagree
+- pseudo-arclength continuation, which follows the branch of steady states
+  around fold points, including the unstable part of S-shaped curves
+"""
+
+import numpy as np
+from typing import Dict, List, Literal, TypedDict
+import src.profiling as profiling
+from src.grn import GRN
+from src.hill import HillTerms
+
+
+class Fold(TypedDict):
+    level: float
+    state: Dict[str, float]
+    direction: Literal["up", "down", "branch"]
+
+
+class ScanResult(TypedDict):
+    # one row per (direction, level): species columns, "level", "direction",
+    # "stable" and "converged" (False where Newton and relaxation both failed)
+    steady: object
+    folds: List[Fold]
+    # input intervals where the up and down sweeps end on different states
+    hysteresis: List[tuple]
+
+
+class _System:
+    """dy/dt of the regulated species as a function of y and the input level p"""
+
+    def __init__(self, grn: GRN, IN, input_name: str):
+        index = grn.index
+        self.hill = HillTerms(index)
+        self.regulated = np.flatnonzero(~index.is_input)
+        self.input = grn.species_index[input_name]
+        self.base = np.zeros(index.n_species)
+        self.base[index.is_input] = np.array(IN, dtype=float)
+
+    def full(self, y, p) -> np.ndarray:
+        y = np.asarray(y, dtype=float)
+        x = np.broadcast_to(self.base, y.shape[:-1] + self.base.shape).copy()
+        x[..., self.input] = p
+        x[..., self.regulated] = y
+        return x
+
+    def __call__(self, y, p) -> np.ndarray:
+        return self.hill.rhs(self.full(y, p))[..., self.regulated]
+
+    def jacobian(self, y, p):
+        """Exact d(rhs)/dy and d(rhs)/dp from the Hill structure"""
+        J = self.hill.jacobian(self.full(y, p))[self.regulated]
+        return J[:, self.regulated], J[:, self.input]
+
+
+def _newton(system: _System, y, p, tol, max_iter):
+    stats = profiling.current()
+    for _ in range(max_iter):
+        if stats is not None:
+            stats.add("newton_iterations")
+        f = system(y, p)
+        if np.max(np.abs(f)) < tol:
+            return y, True
+        J, _ = system.jacobian(y, p)
+        try:
+            dy = np.linalg.solve(J, -f)
+        except np.linalg.LinAlgError:
+            return y, False
+        # concentrations stay non-negative
+        y = np.maximum(y + dy, 0)
+    return y, np.max(np.abs(system(y, p))) < tol
+
+
+def _relax(system: _System, y, p, t_relax):
+    """Integrate towards the attracting steady state, used when Newton fails"""
+    from src.simulator import solve
+
+    stats = profiling.current()
+    if stats is not None:
+        stats.add("relaxations")
+    sol = solve(lambda T, y: system(y, p), [0, t_relax], y)
+    # the solver may overshoot slightly below zero
+    return np.maximum(sol.y[:, -1], 0)
+
+
+def _stable(system: _System, y, p) -> bool:
+    J, _ = system.jacobian(y, p)
+    return bool(np.max(np.linalg.eigvals(J).real) < 0) if len(y) else True
+
+
+def _solve_steady(system, y, p, tol, max_iter, t_relax):
+    y_new, ok = _newton(system, y, p, tol, max_iter)
+    if not ok:
+        y_new, ok = _newton(system, _relax(system, y, p, t_relax), p, tol, max_iter)
+    return y_new, ok
+
+
+def _sweep(system, levels, y0, tol, max_iter, t_relax):
+    states, stable, converged = [], [], []
+    y = y0
+    for p in levels:
+        y, ok = _solve_steady(system, y, p, tol, max_iter, t_relax)
+        states.append(y)
+        stable.append(_stable(system, y, p))
+        converged.append(ok)
+    return np.array(states), stable, converged
+
+
+def _arclength(system, p0, p1, y0, ds, max_steps, tol, max_iter):
+    """Pseudo-arclength continuation of the branch through (y0, p0) towards p1"""
+    stats = profiling.current()
+    n = len(y0)
+    u = np.append(y0, p0)
+    J, Jp = system.jacobian(y0, p0)
+
+    # initial tangent: null vector of [J | Jp], oriented towards p1
+    t = np.linalg.svd(np.column_stack([J, Jp]))[2][-1]
+    if np.sign(t[-1]) != np.sign(p1 - p0):
+        t = -t
+
+    points = [u]
+    lo, hi = min(p0, p1), max(p0, p1)
+    for _ in range(max_steps):
+        if stats is not None:
+            stats.add("arclength_steps")
+        # concentrations and input levels stay non-negative
+        v = np.maximum(u + ds * t, 0)
+        converged = False
+        for _ in range(max_iter):
+            f = system(v[:n], v[n])
+            g = np.dot(v - u, t) - ds
+            if max(np.max(np.abs(f)), abs(g)) < tol:
+                converged = True
+                break
+            J, Jp = system.jacobian(v[:n], v[n])
+            A = np.vstack([np.column_stack([J, Jp]), t])
+            try:
+                v = np.maximum(v - np.linalg.solve(A, np.append(f, g)), 0)
+            except np.linalg.LinAlgError:
+                break
+        if not converged:
+            # corrector did not converge or was singular, retry with a smaller step
+            ds /= 2
+            if ds < 1e-8:
+                break
+            continue
+
+        J, Jp = system.jacobian(v[:n], v[n])
+        t_new = np.linalg.svd(np.column_stack([J, Jp]))[2][-1]
+        if np.dot(t_new, t) < 0:
+            t_new = -t_new
+        u, t = v, t_new
+        points.append(u)
+        if not lo <= u[n] <= hi:
+            break
+
+    return np.array(points)
+
+
+@profiling.instrumented
+def scan_inputs(
+    grn: GRN,
+    input_name: str,
+    levels,
+    IN=None,
+    R0=None,
+    method: Literal["natural", "arclength"] = "natural",
+    tol: float = 1e-8,
+    max_iter: int = 50,
+    t_relax: float = 1000,
+    jump_tol: float = 0.1,
+    ds: float = None,
+    max_steps: int = 10000,
+) -> ScanResult:
+    """
+    Steady states over the levels of one input species.
+
+    Parameters:
+    input_name: the input species that is scanned
+    levels: increasing input levels
+    IN: levels of the other inputs (GRN.input_species_names order), zeros by default
+    R0: initial guess of the regulated species at the first level, the state is
+        relaxed from it (random by default, like get_steady)
+    method: "natural" sweeps up and down; "arclength" follows the branch from
+        the first level with pseudo-arclength continuation
+    tol: Newton tolerance on max |dX/dt|
+    t_relax: integration time used when Newton fails to converge
+    jump_tol: relative change between neighbouring levels that marks a fold
+        in natural continuation, and between the up and down sweeps that
+        marks hysteresis
+    ds: arclength step, 1/100 of the level range by default
+
+    Returns a ScanResult: the steady states as a DataFrame, the fold points and
+    the hysteresis intervals.
+    """
+    import pandas as pd
+
+    levels = np.asarray(levels, dtype=float)
+    n_INS = len(grn.input_species_names)
+    n_RS = len(grn.species_names) - n_INS
+    system = _System(grn, np.zeros(n_INS) if IN is None else IN, input_name)
+
+    if R0 is None:
+        R0 = np.random.random(n_RS)
+    y0 = _relax(system, np.asarray(R0, dtype=float), levels[0], t_relax)
+
+    def frame(states, ps, stable, converged, direction):
+        df = pd.DataFrame(system.full(states, ps), columns=grn.species_names)
+        df["level"] = ps
+        df["direction"] = direction
+        df["stable"] = stable
+        df["converged"] = converged
+        return df
+
+    def state_dict(y, p):
+        return dict(zip(grn.species_names, system.full(y, p).tolist()))
+
+    folds: List[Fold] = []
+    hysteresis = []
+
+    if method == "natural":
+        up, stable_up, converged_up = _sweep(system, levels, y0, tol, max_iter, t_relax)
+        down, stable_down, converged_down = _sweep(
+            system, levels[::-1], up[-1], tol, max_iter, t_relax
+        )
+        down, stable_down = down[::-1], stable_down[::-1]
+        converged_down = converged_down[::-1]
+
+        # a jump between neighbouring levels means the branch ended in a fold
+        for states, direction, order in [(up, "up", 1), (down, "down", -1)]:
+            scale = np.maximum(np.abs(states).max(axis=1), 1.0)
+            jumps = np.max(np.abs(np.diff(states, axis=0)), axis=1) / scale[1:]
+            for i in np.flatnonzero(jumps > jump_tol):
+                # the fold is at the last level reached before the jump
+                j = i if order == 1 else i + 1
+                folds.append(
+                    {
+                        "level": float(levels[j]),
+                        "state": state_dict(states[j], levels[j]),
+                        "direction": direction,
+                    }
+                )
+
+        scale = np.maximum(np.abs(up).max(axis=1), 1.0)
+        differs = np.max(np.abs(up - down), axis=1) / scale > jump_tol
+        start = None
+        for i, d in enumerate(np.append(differs, False)):
+            if d and start is None:
+                start = i
+            elif not d and start is not None:
+                hysteresis.append((float(levels[start]), float(levels[i - 1])))
+                start = None
+
+        steady = pd.concat(
+            [
+                frame(up, levels, stable_up, converged_up, "up"),
+                frame(down, levels, stable_down, converged_down, "down"),
+            ],
+            ignore_index=True,
+        )
+    elif method == "arclength":
+        if ds is None:
+            ds = (levels[-1] - levels[0]) / 100
+        points = _arclength(
+            system, levels[0], levels[-1], y0, ds, max_steps, tol, max_iter
+        )
+        states, ps = points[:, :-1], points[:, -1]
+        stable = [_stable(system, y, p) for y, p in zip(states, ps)]
+        # corrected points converged, the relaxed first point may not have
+        converged = [
+            bool(np.max(np.abs(system(y, p)), initial=0) < tol)
+            for y, p in zip(states, ps)
+        ]
+
+        # folds: the input level turns around along the branch
+        dp = np.diff(ps)
+        for i in np.flatnonzero(np.sign(dp[1:]) != np.sign(dp[:-1])):
+            folds.append(
+                {
+                    "level": float(ps[i + 1]),
+                    "state": state_dict(states[i + 1], ps[i + 1]),
+                    "direction": "branch",
+                }
+            )
+        if len(folds) >= 2:
+            hysteresis.append(tuple(sorted([folds[0]["level"], folds[1]["level"]])))
+
+        steady = frame(states, ps, stable, converged, "branch")
+    else:
+        raise ValueError("Invalid method. Must be 'natural' or 'arclength'")
+
+    return {"steady": steady, "folds": folds, "hysteresis": hysteresis}
@@ -0,0 +1,444 @@
+"""
+Gradient-based fitting of GRN parameters to measured expression data.
+
+The parameters (alpha, Kd, n and optionally delta) are optimized on a log
+scale with L-BFGS-B within bounds. The loss is half the sum of squared
+weighted residuals over all experiments. Its gradient is exact:
+
+- time courses: the forward sensitivities dY/dtheta, integrated with the
+  state in one solve (sensitivity.SensitivitySystem)
+- steady states: the implicit derivative dx/dtheta = -J^-1 d(rhs)/dtheta at
+  the steady state, over the regulated species
+
+Candidate parameters are applied to a copy of GRN.index rather than to the
+GRN, so no model is regenerated per evaluation. Every start of a multi-start
+fit is an independent optimization, run in a process pool.
+"""
+
+import copy
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple, TypedDict
+import src.profiling as profiling
+from src.grn import GRN, GRNIndex
+from src.simulator import BatchRHS, solve, steady_batch
+from src.sensitivity import (
+    SensitivitySystem,
+    _name_columns,
+    parameter_names,
+    parameter_values,
+)
+
+# default bounds of every kind of parameter
+BOUNDS: Dict[str, Tuple[float, float]] = {
+    "alpha": (1e-2, 1e3),
+    "Kd": (1e-2, 1e3),
+    "n": (0.5, 8.0),
+    "delta": (1e-3, 10.0),
+}
+
+
+class Experiment(TypedDict, total=False):
+    """
+    Measurements of one experiment. With T, Y is a time course of shape
+    (len(T), len(species)); without T, Y are steady-state levels of shape
+    (len(species),). NaN entries of Y are missing.
+    """
+
+    IN: Sequence[float]  # input vector, scaled by INS_factor as in simulate_single
+    species: List[str]  # measured species
+    Y: np.ndarray
+    T: np.ndarray
+    R0: np.ndarray  # initial levels of the regulated species, 0 by default
+    sigma: np.ndarray  # standard deviations of Y, 1 by default
+
+
+class FitResult(TypedDict):
+    start: int
+    loss: float
+    rmse: float
+    success: bool
+    message: str
+    n_iterations: int
+    n_evaluations: int
+    # fitted network and its residuals, None if the start failed
+    grn: Optional[GRN]
+    parameters: "pd.DataFrame"  # noqa: F821
+    residuals: Optional["pd.DataFrame"]  # noqa: F821
+
+
+def _indexed(index: GRNIndex, kinds: Sequence[str], theta: np.ndarray) -> GRNIndex:
+    """Copy of index with the parameters set to theta (parameter_names order)"""
+    new = copy.copy(index)
+    new.delta = index.delta.copy()
+    sizes = {
+        "alpha": index.n_genes,
+        "Kd": len(index.reg_Kd),
+        "n": len(index.reg_n),
+        "delta": int((~index.is_input).sum()),
+    }
+    start = 0
+    for kind in kinds:
+        values = theta[start : start + sizes[kind]]
+        start += sizes[kind]
+        if kind == "alpha":
+            new.alpha = values
+        elif kind == "Kd":
+            new.reg_Kd = values
+        elif kind == "n":
+            new.reg_n = values
+        else:
+            new.delta[~index.is_input] = values
+    return new
+
+
+def apply_parameters(grn: GRN, kinds: Sequence[str], theta: np.ndarray) -> GRN:
+    """Copy of grn with the parameters set to theta (parameter_names order)"""
+    fitted = copy.deepcopy(grn)
+    for name, value in zip(parameter_names(grn, kinds), theta.tolist()):
+        if name[0] == "alpha":
+            fitted.update_gene(name[1], alpha=value)
+        elif name[0] == "delta":
+            fitted.update_species(name[1], value)
+        else:
+            fitted.update_regulator(name[1], name[2], **{name[0]: value})
+    return fitted
+
+
+def _prepare(index: GRNIndex, experiment: Experiment, INS_factor: float) -> dict:
+    """Initial state, observed species, data and weights of an experiment"""
+    n_RS = int((~index.is_input).sum())
+    X0 = np.asarray(experiment["IN"], dtype=float) * INS_factor
+    R0 = experiment.get("R0")
+    R0 = np.zeros(n_RS) if R0 is None else np.asarray(R0, dtype=float)
+
+    Y = np.asarray(experiment["Y"], dtype=float)
+    T = experiment.get("T")
+    if T is not None:
+        T = np.asarray(T, dtype=float)
+    shape = (
+        (len(experiment["species"]),)
+        if T is None
+        else (len(T), len(experiment["species"]))
+    )
+    if Y.shape != shape:
+        raise ValueError(f"Y has shape {Y.shape}, expected {shape}")
+
+    sigma = np.broadcast_to(
+        np.asarray(experiment.get("sigma", 1.0), dtype=float), shape
+    )
+    observed = ~np.isnan(Y)
+    return {
+        "S0": np.append(X0, R0),
+        "T": T,
+        "species": list(experiment["species"]),
+        "observed": np.array([index.species_index[s] for s in experiment["species"]]),
+        "mask": observed,
+        "Y": np.where(observed, Y, 0.0),
+        "w": np.where(observed, 1 / sigma, 0.0),
+    }
+
+
+class _Objective:
+    """Loss of the log-parameters over all experiments and its exact gradient"""
+
+    def __init__(
+        self,
+        index: GRNIndex,
+        kinds: Sequence[str],
+        experiments: List[Experiment],
+        INS_factor: float,
+        eps: float,
+        max_time: float,
+        rtol: float,
+        atol: float,
+    ):
+        self.index = index
+        self.kinds = list(kinds)
+        self.experiments = [_prepare(index, e, INS_factor) for e in experiments]
+        self.eps = eps
+        self.max_time = max_time
+        self.rtol = rtol
+        self.atol = atol
+
+    def _time_course(self, system: SensitivitySystem, data: dict):
+        T = data["T"]
+        z0 = np.concatenate([data["S0"], np.zeros(system.S * system.P)])
+        sol = solve(system, [0, T[-1]], z0, rtol=self.rtol, atol=self.atol)
+        if not sol.success:
+            raise RuntimeError(sol.message)
+        Y, dY = system.split(sol.sol(T).T)
+        return Y[:, data["observed"]], dY[:, data["observed"]]
+
+    def _steady_state(self, system: SensitivitySystem, data: dict):
+        hill = system.hill
+        reg = system.regulated
+        model = BatchRHS(hill, np.empty(0, dtype=np.int64), 1)
+        X, converged = steady_batch(model, data["S0"][None], self.eps, self.max_time)
+        if not converged[0]:
+            # e.g. the parameters make the circuit oscillate, the start fails
+            raise RuntimeError(f"no steady state within {self.max_time}")
+        x = X[0]
+
+        # Newton steps to the exact steady state, the gradient assumes rhs = 0
+        for _ in range(20):
+            F = hill.rhs(x)[reg]
+            if np.max(np.abs(F), initial=0) < 1e-12:
+                break
+            J = hill.jacobian(x)[np.ix_(reg, reg)]
+            step = np.linalg.lstsq(J, F, rcond=None)[0]
+            if np.any(x[reg] - step < 0):
+                break
+            x[reg] -= step
+
+        J = hill.jacobian(x)[np.ix_(reg, reg)]
+        dx = np.zeros((system.S, system.P))
+        dx[reg] = np.linalg.lstsq(J, -system.parameter_jacobian(x)[reg], rcond=None)[0]
+        return x[data["observed"]], dx[data["observed"]]
+
+    def predict(self, log_theta: np.ndarray):
+        """Predictions of every experiment and their derivatives by theta"""
+        system = SensitivitySystem(
+            _indexed(self.index, self.kinds, np.exp(log_theta)), self.kinds
+        )
+        for data in self.experiments:
+            if data["T"] is None:
+                yield self._steady_state(system, data)
+            else:
+                yield self._time_course(system, data)
+
+    def __call__(self, log_theta: np.ndarray):
+        loss = 0.0
+        grad = np.zeros(len(log_theta))
+        for data, (Y, dY) in zip(self.experiments, self.predict(log_theta)):
+            r = (Y - data["Y"]) * data["w"]
+            loss += 0.5 * float(np.sum(r**2))
+            grad += np.tensordot(r * data["w"], dY, axes=r.ndim)
+        # chain rule of the log scale, dtheta/dlog(theta) = theta
+        return loss, grad * np.exp(log_theta)
+
+
+class _Problem:
+    """Objective and bounds of a fit, shared by all of its starts"""
+
+    def __init__(self, objective: _Objective, bounds: np.ndarray, maxiter: int):
+        self.objective = objective
+        self.bounds = bounds
+        self.maxiter = maxiter
+
+    def __call__(self, x0: np.ndarray) -> dict:
+        from scipy.optimize import minimize
+
+        # best finite evaluation, and the number of non-finite ones
+        best = {"x": x0, "loss": float("inf")}
+        invalid = [0]
+
+        def evaluate(x):
+            loss, grad = self.objective(x)
+            if not (np.isfinite(loss) and np.isfinite(grad).all()):
+                # a NaN would stop L-BFGS-B where it is; an infinite loss
+                # makes the line search back off instead
+                invalid[0] += 1
+                return np.inf, np.zeros_like(x)
+            if loss < best["loss"]:
+                best.update(x=np.array(x), loss=loss)
+            return loss, grad
+
+        def failed(message: str, n_evaluations: int = 0) -> dict:
+            return {
+                "x": x0,
+                "loss": float("inf"),
+                "success": False,
+                "message": message,
+                "n_iterations": 0,
+                "n_evaluations": n_evaluations,
+            }
+
+        try:
+            result = minimize(
+                evaluate,
+                x0,
+                jac=True,
+                method="L-BFGS-B",
+                bounds=self.bounds,
+                options={"maxiter": self.maxiter},
+            )
+        except Exception as e:
+            # a diverging start must not stop the others
+            return failed(f"{type(e).__name__}: {e}")
+
+        if not np.isfinite(best["loss"]):
+            return failed("non-finite loss or gradient", int(result.nfev))
+
+        message = str(result.message)
+        if invalid[0]:
+            message += f" ({invalid[0]} non-finite evaluations)"
+        return {
+            "x": best["x"],
+            "loss": float(best["loss"]),
+            # a start that hit non-finite values where it stopped is not a fit
+            "success": bool(result.success) and bool(np.isfinite(result.fun)),
+            "message": message,
+            "n_iterations": int(result.nit),
+            "n_evaluations": int(result.nfev),
+        }
+
+
+# problem of a worker process, built once by the pool initializer
+_worker: Optional[_Problem] = None
+
+
+def _init_worker(*args):
+    global _worker
+    _worker = _Problem(*args)
+
+
+def _run_worker(x0: np.ndarray) -> dict:
+    return _worker(x0)
+
+
+def residuals(
+    grn: GRN,
+    experiments: List[Experiment],
+    INS_factor=1,
+    eps: float = 10 ** (-3),
+    max_time: float = 1000,
+    rtol: float = 1e-6,
+    atol: float = 1e-9,
+):
+    """
+    Residuals of a GRN on the experiments, one row per measurement:
+    experiment, time (NaN for steady states), species, observed, predicted,
+    residual (predicted - observed) and weighted (residual / sigma).
+    """
+    import pandas as pd
+
+    objective = _Objective(
+        grn.index, (), experiments, INS_factor, eps, max_time, rtol, atol
+    )
+    frames = []
+    for i, (data, (Y, _)) in enumerate(
+        zip(objective.experiments, objective.predict(np.empty(0)))
+    ):
+        mask = data["mask"]
+        T = data["T"] if data["T"] is not None else np.array([np.nan])
+        time, species = np.meshgrid(T, data["species"], indexing="ij")
+        Y = Y.reshape(time.shape)
+        observed = data["Y"].reshape(time.shape)
+        w = data["w"].reshape(time.shape)
+        mask = mask.reshape(time.shape)
+        frames.append(
+            pd.DataFrame(
+                {
+                    "experiment": i,
+                    "time": time[mask],
+                    "species": species[mask],
+                    "observed": observed[mask],
+                    "predicted": Y[mask],
+                    "residual": (Y - observed)[mask],
+                    "weighted": ((Y - observed) * w)[mask],
+                }
+            )
+        )
+    return pd.concat(frames, ignore_index=True)
+
+
+@profiling.instrumented
+def fit(
+    grn: GRN,
+    experiments: List[Experiment],
+    parameters: Sequence[str] = ("alpha", "Kd", "n"),
+    n_starts: int = 10,
+    bounds: Optional[Dict[str, Tuple[float, float]]] = None,
+    INS_factor=1,
+    maxiter: int = 200,
+    eps: float = 10 ** (-3),
+    max_time: float = 1000,
+    rtol: float = 1e-6,
+    atol: float = 1e-9,
+    processes: Optional[int] = None,
+    seed=None,
+) -> List[FitResult]:
+    """
+    Fit the parameters of a GRN to time-course and/or steady-state data.
+
+    Parameters:
+    experiments: list of Experiment dicts
+    parameters: kinds of parameters to fit, any of "alpha", "Kd", "n" and "delta"
+    n_starts: number of starts; the first starts from the parameters of grn,
+        the others from log-uniform samples within the bounds
+    bounds: (low, high) per kind of parameter, BOUNDS by default
+    INS_factor: level of the inputs, as in simulate_single
+    maxiter: iterations of L-BFGS-B per start
+    eps: convergence threshold of the steady-state search
+    max_time: longest integration of the steady-state search; a start whose
+        parameters have no steady state by then fails
+    rtol, atol: solver tolerances of the time courses
+    processes: run starts in a process pool of this size
+    seed: seed of the sampled starts
+
+    Returns the result of every start, best (lowest loss) first.
+    """
+    import pandas as pd
+
+    bounds = {**BOUNDS, **(bounds or {})}
+    names = parameter_names(grn, parameters)
+    theta0 = parameter_values(grn, parameters)
+    low = np.log([bounds[name[0]][0] for name in names])
+    high = np.log([bounds[name[0]][1] for name in names])
+
+    rng = np.random.default_rng(seed)
+    starts = [np.clip(np.log(theta0), low, high)]
+    starts += [rng.uniform(low, high) for _ in range(n_starts - 1)]
+
+    objective = _Objective(
+        grn.index, parameters, experiments, INS_factor, eps, max_time, rtol, atol
+    )
+    args = (objective, np.column_stack([low, high]), maxiter)
+
+    if processes is None or processes <= 1:
+        problem = _Problem(*args)
+        runs = [problem(x0) for x0 in starts]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(
+            processes, initializer=_init_worker, initargs=args
+        ) as pool:
+            runs = list(pool.map(_run_worker, starts))
+
+    stats = profiling.current()
+    if stats is not None:
+        stats.add("starts", len(starts))
+        stats.add("objective_evaluations", sum(r["n_evaluations"] for r in runs))
+
+    results: List[FitResult] = []
+    for i, (x0, run) in enumerate(zip(starts, runs)):
+        theta = np.exp(run["x"])
+        failed = not np.isfinite(run["loss"])
+        fitted = None if failed else apply_parameters(grn, parameters, theta)
+        residual = (
+            None
+            if failed
+            else residuals(fitted, experiments, INS_factor, eps, max_time, rtol, atol)
+        )
+        results.append(
+            {
+                "start": i,
+                "loss": run["loss"],
+                "rmse": (
+                    float("nan")
+                    if failed
+                    else float(np.sqrt(np.mean(residual["residual"] ** 2)))
+                ),
+                "success": run["success"],
+                "message": run["message"],
+                "n_iterations": run["n_iterations"],
+                "n_evaluations": run["n_evaluations"],
+                "grn": fitted,
+                "parameters": pd.DataFrame(
+                    {**_name_columns(names), "initial": np.exp(x0), "fitted": theta}
+                ),
+                "residuals": residual,
+            }
+        )
+    return sorted(results, key=lambda r: r["loss"])
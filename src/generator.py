@@ -0,0 +1,157 @@
+"""
+Random GRNs for benchmarks and batch jobs, and their export as qual SBML.
+"""
+
+import numpy as np
+from typing import Literal, Sequence
+from src.grn import GRN
+from src.helpers import get_param_value
+from src.network_builder import Builder
+
+DegreeDistribution = Literal["fixed", "uniform", "poisson"]
+
+
+def _in_degree(in_degree, degree_dist: DegreeDistribution, n_species: int) -> int:
+    if degree_dist == "fixed":
+        k = int(in_degree)
+    elif degree_dist == "uniform":
+        low, high = in_degree
+        k = np.random.randint(low, high + 1)
+    elif degree_dist == "poisson":
+        # at least one regulator, in_degree is the mean
+        k = 1 + np.random.poisson(max(in_degree - 1, 0))
+    else:
+        raise ValueError("Invalid degree distribution")
+
+    return int(min(max(k, 1), n_species))
+
+
+def random_grn(
+    n_species: int,
+    n_inputs: int = 2,
+    in_degree=(1, 3),
+    degree_dist: DegreeDistribution = "uniform",
+    logic_types: Sequence[str] = ("and", "or"),
+    p_activation: float = 0.5,
+    alpha=(5, 20),
+    Kd=(1, 10),
+    n=(1, 4),
+    delta=(0.05, 0.5),
+    seed: int | None = None,
+) -> GRN:
+    """
+    Generate a random GRN with one gene per non-input species.
+
+    Parameters:
+    n_species: number of regulated (non-input) species
+    n_inputs: number of input species
+    in_degree: regulators per gene, an int for "fixed", a (low, high) pair
+        for "uniform" or the mean for "poisson"
+    degree_dist: in-degree distribution ("fixed", "uniform" or "poisson")
+    logic_types: logic types a gene is drawn from
+    p_activation: probability that a regulator is an activator
+    alpha, Kd, n, delta: parameter values or ranges, see helpers.get_param_value
+    seed: seed for numpy's global random state
+    """
+    if seed is not None:
+        np.random.seed(seed)
+
+    builder = Builder()
+
+    inputs = [builder.species(f"X{i + 1}") for i in range(n_inputs)]
+    species = [
+        builder.species(f"Y{i + 1}", get_param_value(delta)) for i in range(n_species)
+    ]
+    regulators = inputs + species
+
+    for target in species:
+        k = _in_degree(in_degree, degree_dist, len(regulators))
+        chosen = np.random.choice(len(regulators), size=k, replace=False)
+
+        regs = []
+        for i in chosen:
+            params = {"Kd": get_param_value(Kd), "n": get_param_value(n)}
+            if np.random.random() < p_activation:
+                regs.append(regulators[i].activates(**params))
+            else:
+                regs.append(regulators[i].represses(**params))
+
+        logic_type = str(np.random.choice(logic_types))
+        builder.gene(regs, [target], get_param_value(alpha), logic_type)
+
+    return builder.grn
+
+
+def write_qual_sbml(grn: GRN, filename: str) -> None:
+    """
+    Write the Boolean abstraction of a GRN as a qual SBML model readable
+    by qual_sbml.QualModel. Every species is Boolean (max level 1).
+    """
+    import libsbml
+
+    doc = libsbml.SBMLDocument(libsbml.SBMLNamespaces(3, 1, "qual", 1))
+    doc.setPackageRequired("qual", True)
+    model = doc.createModel()
+    model.setId("generated")
+
+    compartment = model.createCompartment()
+    compartment.setId("cell")
+    compartment.setConstant(True)
+
+    qual: libsbml.QualModelPlugin = model.getPlugin("qual")
+
+    for name in grn.species_names:
+        s = qual.createQualitativeSpecies()
+        s.setId(name)
+        s.setCompartment("cell")
+        s.setConstant(False)
+        s.setMaxLevel(1)
+
+    # one disjunct per gene producing the species
+    clauses = {name: [] for name in grn.species_names}
+    inputs = {name: set() for name in grn.species_names}
+    constitutive = set()
+
+    for name in grn.input_species_names:
+        clauses[name].append(f"({name} >= 1)")
+        inputs[name].add(name)
+
+    for gene in grn.genes:
+        literals = [
+            f"({r['name']} >= 1)" if r["type"] == 1 else f"({r['name']} < 1)"
+            for r in gene["regulators"]
+        ]
+        op = " || " if gene["logic_type"] == "or" else " && "
+
+        for product in gene["products"]:
+            if not literals:
+                constitutive.add(product["name"])
+                continue
+            clauses[product["name"]].append(f"({op.join(literals)})")
+            inputs[product["name"]].update(r["name"] for r in gene["regulators"])
+
+    for name in grn.species_names:
+        if not clauses[name] and name not in constitutive:
+            continue
+
+        t = qual.createTransition()
+        t.setId(f"tr_{name}")
+
+        for reg in sorted(inputs[name]):
+            inp = t.createInput()
+            inp.setQualitativeSpecies(reg)
+            inp.setTransitionEffect(libsbml.INPUT_TRANSITION_EFFECT_NONE)
+
+        out = t.createOutput()
+        out.setQualitativeSpecies(name)
+        out.setTransitionEffect(libsbml.OUTPUT_TRANSITION_EFFECT_ASSIGNMENT_LEVEL)
+
+        default = t.createDefaultTerm()
+        default.setResultLevel(1 if name in constitutive else 0)
+
+        if name not in constitutive:
+            term = t.createFunctionTerm()
+            term.setResultLevel(1)
+            term.setMath(libsbml.parseL3Formula(" || ".join(clauses[name])))
+
+    libsbml.writeSBMLToFile(doc, filename)
@@ -1,11 +1,7 @@
+import weakref
 import numpy as np
-import src.simulator as simulator
 from src.helpers import powerset
-from typing import Dict, List, TypedDict, Literal
-
-import networkx as nx
-import matplotlib.pyplot as plt
-
+from typing import Callable, Dict, List, Optional, TypedDict, Literal
 
 LogicType = Literal["and", "or", ""]
 
@@ -33,24 +29,215 @@ class Gene(TypedDict):
     logic_type: LogicType
 
 
+EventKind = Literal[
+    "species_added",
+    "species_updated",
+    "gene_added",
+    "gene_updated",
+    "regulator_added",
+    "regulator_removed",
+    "regulator_updated",
+]
+
+
+class GRNEvent(TypedDict):
+    kind: EventKind
+    # index of the changed gene, None for species events
+    gene: Optional[int]
+    # species whose equations are affected by the change
+    species: List[str]
+    # changed fields, e.g. ["Kd"] or ["alpha", "logic_type"]
+    fields: List[str]
+
+
+class GRNIndex:
+    """
+    Indexed, array-backed snapshot of a GRN shared by the simulation engines.
+
+    Species and genes are referred to by their position in GRN.species_names
+    and GRN.genes. Regulations and products are stored as sparse incidence
+    lists (COO) with parallel parameter arrays; the entries of gene g are
+    reg_ptr[g]:reg_ptr[g + 1] and prod_ptr[g]:prod_ptr[g + 1].
+    """
+
+    def __init__(self, grn: "GRN"):
+        self.species_names: List[str] = list(grn.species_names)
+        self.species_index: Dict[str, int] = dict(grn.species_index)
+        n_species = len(self.species_names)
+        n_genes = len(grn.genes)
+
+        self.delta = np.array([s["delta"] for s in grn.species], dtype=float)
+        self.is_input = np.zeros(n_species, dtype=bool)
+        self.is_input[[self.species_index[s] for s in grn.input_species_names]] = True
+
+        self.alpha = np.array([g["alpha"] for g in grn.genes], dtype=float)
+        self.logic_type = np.array([g["logic_type"] for g in grn.genes], dtype="<U3")
+
+        n_regs = sum(len(g["regulators"]) for g in grn.genes)
+        n_prods = sum(len(g["products"]) for g in grn.genes)
+
+        self.reg_ptr = np.zeros(n_genes + 1, dtype=np.int64)
+        self.reg_gene = np.empty(n_regs, dtype=np.int64)
+        self.reg_species = np.empty(n_regs, dtype=np.int64)
+        self.reg_type = np.empty(n_regs, dtype=np.int8)
+        self.reg_Kd = np.empty(n_regs, dtype=float)
+        self.reg_n = np.empty(n_regs, dtype=float)
+
+        self.prod_ptr = np.zeros(n_genes + 1, dtype=np.int64)
+        self.prod_gene = np.empty(n_prods, dtype=np.int64)
+        self.prod_species = np.empty(n_prods, dtype=np.int64)
+
+        r = p = 0
+        for g, gene in enumerate(grn.genes):
+            for reg in gene["regulators"]:
+                self.reg_gene[r] = g
+                self.reg_species[r] = self.species_index[reg["name"]]
+                self.reg_type[r] = reg["type"]
+                self.reg_Kd[r] = reg["Kd"]
+                self.reg_n[r] = reg["n"]
+                r += 1
+            for prod in gene["products"]:
+                self.prod_gene[p] = g
+                self.prod_species[p] = self.species_index[prod["name"]]
+                p += 1
+            self.reg_ptr[g + 1] = r
+            self.prod_ptr[g + 1] = p
+
+    @property
+    def n_species(self) -> int:
+        return len(self.species_names)
+
+    @property
+    def n_genes(self) -> int:
+        return len(self.alpha)
+
+    def regulators(self, gene: int) -> slice:
+        """Slice into the reg_* arrays for one gene"""
+        return slice(self.reg_ptr[gene], self.reg_ptr[gene + 1])
+
+    def products(self, gene: int) -> slice:
+        """Slice into the prod_* arrays for one gene"""
+        return slice(self.prod_ptr[gene], self.prod_ptr[gene + 1])
+
+    def regulator_matrix(self):
+        """Sparse (genes x species) matrix of regulation types (1 / -1)"""
+        from scipy.sparse import csr_matrix
+
+        return csr_matrix(
+            (self.reg_type, (self.reg_gene, self.reg_species)),
+            shape=(self.n_genes, self.n_species),
+        )
+
+    def product_matrix(self):
+        """Sparse (genes x species) 0/1 matrix of gene products"""
+        from scipy.sparse import csr_matrix
+
+        return csr_matrix(
+            (
+                np.ones(len(self.prod_gene), dtype=np.int8),
+                (self.prod_gene, self.prod_species),
+            ),
+            shape=(self.n_genes, self.n_species),
+        )
+
+    def regulation_edges(self) -> np.ndarray:
+        """
+        Species-level regulation edges as an (E, 3) array of
+        (regulator, target, type), one row per regulator and product of a gene.
+        """
+        counts = np.diff(self.prod_ptr)[self.reg_gene]
+        regs = np.repeat(np.arange(len(self.reg_gene)), counts)
+        offsets = np.arange(len(regs)) - np.repeat(np.cumsum(counts) - counts, counts)
+        targets = self.prod_species[self.prod_ptr[self.reg_gene[regs]] + offsets]
+        return np.column_stack(
+            [self.reg_species[regs], targets, self.reg_type[regs]]
+        ).astype(np.int64)
+
+
 class GRN:
     def __init__(self):
         self.species: List[Species] = []
         self.species_names: List[str] = []
+        self.species_index: Dict[str, int] = {}
         self.input_species_names: List[str] = []
         self.genes: List[Gene] = []
+        self._index: GRNIndex | None = None
+        self._listeners = []
+
+    def __getstate__(self):
+        # subscribers are local to a process, e.g. when sent to a process pool
+        state = self.__dict__.copy()
+        state["_listeners"] = []
+        return state
+
+    def subscribe(self, callback: Callable[[GRNEvent], None]) -> None:
+        """
+        Call callback(event) after every change made through the GRN methods.
+        Bound methods are held weakly, so subscribers can be garbage collected.
+        """
+        if hasattr(callback, "__self__"):
+            self._listeners.append(weakref.WeakMethod(callback))
+        else:
+            self._listeners.append(lambda: callback)
+
+    def unsubscribe(self, callback: Callable[[GRNEvent], None]) -> None:
+        self._listeners = [ref for ref in self._listeners if ref() != callback]
+
+    def _emit(self, kind: EventKind, gene=None, species=(), fields=()) -> None:
+        event: GRNEvent = {
+            "kind": kind,
+            "gene": gene,
+            "species": list(species),
+            "fields": list(fields),
+        }
+        listeners = []
+        for ref in self._listeners:
+            callback = ref()
+            if callback is not None:
+                callback(event)
+                listeners.append(ref)
+        self._listeners = listeners
+
+    @property
+    def index(self) -> GRNIndex:
+        """
+        Indexed representation of the network, built on first use and
+        cached until the next change made through the GRN methods.
+        """
+        if self._index is None:
+            self._index = GRNIndex(self)
+        return self._index
+
+    def reindex(self) -> GRNIndex:
+        """
+        Rebuild the index from the species and gene dicts. Needed after they
+        were edited directly instead of through the GRN methods.
+        """
+        self._index = GRNIndex(self)
+        return self._index
 
     def add_input_species(self, name: str):
         """
         Adds an input species to the GRN.
         Input species do not degrade.
         """
-        self.add_species(name, 0)
         self.input_species_names.append(name)
+        self.add_species(name, 0)
 
     def add_species(self, name: str, delta: float):
+        self.species_index[name] = len(self.species_names)
         self.species.append({"name": name, "delta": delta})
         self.species_names.append(name)
+        self._index = None
+        self._emit("species_added", species=[name], fields=["delta"])
+
+    def update_species(self, name: str, delta: float) -> None:
+        """Change the degradation rate of a species"""
+        i = self.species_index[name]
+        self.species[i]["delta"] = delta
+        if self._index is not None:
+            self._index.delta[i] = delta
+        self._emit("species_updated", species=[name], fields=["delta"])
 
     """
         regulator = {'name': str - name,
@@ -85,22 +272,110 @@ class GRN:
         if input_logic_type == "mixed":
             logic_type = np.random.choice(["and", "or"])
 
+        # copies, so that later updates do not leak into the caller's lists
         gene = {
             "alpha": alpha,
-            "regulators": regulators,
-            "products": products,
+            "regulators": [dict(r) for r in regulators],
+            "products": [dict(p) for p in products],
             "logic_type": logic_type,
         }
 
         for regulator in regulators:
-            if regulator["name"] not in self.species_names:
+            if regulator["name"] not in self.species_index:
                 print(f"{regulator['name']} not in species!")
 
         for product in products:
-            if product["name"] not in self.species_names:
+            if product["name"] not in self.species_index:
                 print(f"{product['name']} not in species!")
 
         self.genes.append(gene)
+        self._index = None
+        self._emit(
+            "gene_added",
+            gene=len(self.genes) - 1,
+            species=[p["name"] for p in products],
+            fields=["alpha", "logic_type", "regulators", "products"],
+        )
+
+    def _products(self, gene: int) -> List[str]:
+        return [p["name"] for p in self.genes[gene]["products"]]
+
+    def _regulator_position(self, gene: int, name: str) -> int:
+        for i, regulator in enumerate(self.genes[gene]["regulators"]):
+            if regulator["name"] == name:
+                return i
+        raise KeyError(f"{name} does not regulate gene {gene}")
+
+    def update_gene(
+        self, gene: int, alpha: float = None, logic_type: LogicType = None
+    ) -> None:
+        """Change the production rate and/or logic type of a gene"""
+        fields = []
+        if alpha is not None:
+            self.genes[gene]["alpha"] = alpha
+            if self._index is not None:
+                self._index.alpha[gene] = alpha
+            fields.append("alpha")
+        if logic_type is not None:
+            assert logic_type in ["and", "or", ""], "Invalid logic type"
+            self.genes[gene]["logic_type"] = logic_type
+            if self._index is not None:
+                self._index.logic_type[gene] = logic_type
+            fields.append("logic_type")
+
+        self._emit(
+            "gene_updated", gene=gene, species=self._products(gene), fields=fields
+        )
+
+    def update_regulator(
+        self,
+        gene: int,
+        name: str,
+        Kd: float = None,
+        n: float = None,
+        type: Literal[-1, 1] = None,
+    ) -> None:
+        """Change the parameters of the regulation of a gene by species name"""
+        i = self._regulator_position(gene, name)
+        regulator = self.genes[gene]["regulators"][i]
+        values = {"Kd": Kd, "n": n, "type": type}
+        fields = [field for field, value in values.items() if value is not None]
+
+        for field in fields:
+            regulator[field] = values[field]
+            if self._index is not None:
+                getattr(self._index, f"reg_{field}")[self._index.reg_ptr[gene] + i] = (
+                    values[field]
+                )
+
+        self._emit(
+            "regulator_updated", gene=gene, species=self._products(gene), fields=fields
+        )
+
+    def add_regulator(self, gene: int, regulator: Regulator) -> None:
+        """Add a regulator to an existing gene"""
+        if regulator["name"] not in self.species_index:
+            print(f"{regulator['name']} not in species!")
+
+        self.genes[gene]["regulators"].append(dict(regulator))
+        self._index = None
+        self._emit(
+            "regulator_added",
+            gene=gene,
+            species=self._products(gene),
+            fields=["regulators"],
+        )
+
+    def remove_regulator(self, gene: int, name: str) -> None:
+        """Remove the regulation of a gene by species name"""
+        del self.genes[gene]["regulators"][self._regulator_position(gene, name)]
+        self._index = None
+        self._emit(
+            "regulator_removed",
+            gene=gene,
+            species=self._products(gene),
+            fields=["regulators"],
+        )
 
     def generate_equations(self) -> Dict[str, List[str]]:
         """
@@ -112,42 +387,68 @@ class GRN:
             equations[species["name"]] = [f"-{species['name']}*{species['delta']}"]
 
         for gene in self.genes:
-            up: List[str] = []
-            down: List[str] = []
-            logic_type = gene["logic_type"]
+            terms = self.gene_term(gene)
 
-            for regulator in gene["regulators"]:
-                name = regulator["name"]
-                n = regulator["n"]
-                Kd = regulator["Kd"]
+            for product in gene["products"]:
+                equations[product["name"]].append(terms)
 
-                regulator_term = f"(({name}/{Kd})**{n})"
+        return equations
 
-                if regulator["type"] == 1:
-                    up.append(regulator_term)
+    @staticmethod
+    def gene_term(gene: Gene) -> str:
+        """
+        Production term of a single gene, added to the equation of each product.
+        """
+        up: List[str] = []
+        down: List[str] = []
+        logic_type = gene["logic_type"]
 
-                down.append(regulator_term)
+        for regulator in gene["regulators"]:
+            name = regulator["name"]
+            n = regulator["n"]
+            Kd = regulator["Kd"]
 
-            if not up:
-                up = ["1"]
+            regulator_term = f"(({name}/{Kd})**{n})"
 
-            if logic_type == "or":
-                up = "+".join(powerset(up, op="*"))
-            elif logic_type == "and":
-                up = "*".join(up)
-            elif logic_type == "":
-                up = up[0]
-            else:
-                raise ValueError("Invalid logic type. Must be 'and', 'or' or ''")
+            if regulator["type"] == 1:
+                up.append(regulator_term)
 
-            down = "+".join(["1"] + powerset(down, op="*"))
+            down.append(regulator_term)
 
-            terms = f"{gene['alpha']}*({up})/({down})"
+        if not up:
+            up = ["1"]
 
-            for product in gene["products"]:
-                equations[product["name"]].append(terms)
+        if logic_type == "or":
+            up = "+".join(powerset(up, op="*"))
+        elif logic_type == "and":
+            up = "*".join(up)
+        elif logic_type == "":
+            up = up[0]
+        else:
+            raise ValueError("Invalid logic type. Must be 'and', 'or' or ''")
 
-        return equations
+        down = "+".join(["1"] + powerset(down, op="*"))
+
+        return f"{gene['alpha']}*({up})/({down})"
+
+    @staticmethod
+    def model_source(equations: Dict[str, str]) -> str:
+        """
+        Source of the model module for {species: right-hand side} equations.
+        """
+        all_keys = ", ".join(equations.keys())
+        all_dkeys = ", ".join([f"d{key}" for key in equations.keys()])
+
+        lines = ["import numpy as np \n", "def solve_model(T,state):"]
+        lines.append(f"    {all_keys} = state")
+        for key, rhs in equations.items():
+            lines.append(f"    d{key} = {rhs}")
+        lines.append(f"    return np.array([{all_dkeys}])")
+        lines.append("")
+        lines.append("def solve_model_steady(state):")
+        lines.append("    return solve_model(0, state)")
+
+        return "\n".join(lines) + "\n"
 
     def generate_model(self, fname: str = "model.py") -> None:
         """
@@ -156,49 +457,24 @@ class GRN:
         equations = self.generate_equations()
 
         with open(fname, "w") as f:
-            print("import numpy as np \n", file=f)
-            print("def solve_model(T,state):", file=f)
-
-            all_keys = ", ".join(equations.keys())
-            all_dkeys = ", ".join([f"d{key}" for key in equations.keys()])
-
-            print(f"    {all_keys} = state", file=f)
-
-            for key in equations.keys():
-                print(f"    d{key} = {'+'.join(equations[key])}", file=f)
-
-            print(f"    return np.array([{all_dkeys}])", file=f)
-
-            print("", file=f)
-            print("def solve_model_steady(state):", file=f)
-            print("    return solve_model(0, state)", file=f)
+            f.write(self.model_source({k: "+".join(v) for k, v in equations.items()}))
 
     def plot_network(self) -> None:
         """
         Visualize the network structure.
         """
-        activators: Dict[str, List[str]] = {s: [] for s in self.species_names}
-        inhibitors: Dict[str, List[str]] = {s: [] for s in self.species_names}
-
-        for gene in self.genes:
-            for product in gene["products"]:
-                activators[product["name"]].extend(
-                    [x["name"] for x in gene["regulators"] if x["type"] == 1]
-                )
-                inhibitors[product["name"]].extend(
-                    [x["name"] for x in gene["regulators"] if x["type"] == -1]
-                )
+        import networkx as nx
+        import matplotlib.pyplot as plt
 
+        names = self.species_names
         edges_act = set()
         edges_inh = set()
 
-        for prod in activators:
-            for reg in activators[prod]:
-                edges_act.add((reg, prod))
-
-        for prod in inhibitors:
-            for reg in inhibitors[prod]:
-                edges_inh.add((reg, prod))
+        for reg, prod, reg_type in self.index.regulation_edges():
+            if reg_type == 1:
+                edges_act.add((names[reg], names[prod]))
+            else:
+                edges_inh.add((names[reg], names[prod]))
 
         edges_both = edges_act & edges_inh
         edges_act -= edges_both
@@ -226,6 +502,8 @@ class GRN:
 
 
 if __name__ == "__main__":
+    import src.simulator as simulator
+
     my_grn = GRN()
     my_grn.add_input_species("X1")
     my_grn.add_input_species("X2")
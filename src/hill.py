@@ -0,0 +1,195 @@
+import numpy as np
+from src.grn import GRN, GRNIndex
+
+
+class HillTerms:
+    """
+    Vectorized evaluation of the GRN production terms over a batch of states.
+
+    Evaluates the same dynamics as the equations of GRN.generate_equations, but
+    from the arrays of GRN.index, for states of shape (S,) or (B, S). The
+    regulators of each gene are padded to the largest in-degree K, so that one
+    evaluation is a handful of (B, G, K) array operations.
+
+    For a gene with regulator terms h_r = (x_r / Kd_r) ** n_r:
+        down = 1 + sum of all products of subsets of h = prod(1 + h)
+        and: up = prod of activator h
+        or:  up = sum of products of subsets of activator h = prod(1 + h) - 1
+        '':  up = h of the first activator
+    with up = 1 for genes without activators.
+
+    With `genes`, only that subset of genes is evaluated.
+
+    jacobian and parameter_jacobian give the exact derivatives of rhs for one
+    state, derived from the same structure.
+    """
+
+    def __init__(self, grn: GRN | GRNIndex, genes: np.ndarray = None):
+        index = grn.index if isinstance(grn, GRN) else grn
+        self.index = index
+        if genes is None:
+            genes = np.arange(index.n_genes)
+        genes = np.asarray(genes, dtype=np.int64)
+        self.genes = genes
+        G = len(genes)
+        counts = np.diff(index.reg_ptr)[genes]
+        K = int(counts.max()) if G else 0
+        self.K = K
+
+        # regulator and product entries of the selected genes
+        regs = np.concatenate(
+            [np.arange(index.reg_ptr[g], index.reg_ptr[g + 1]) for g in genes]
+            + [np.empty(0, dtype=np.int64)]
+        )
+        selected = np.zeros(index.n_genes, dtype=bool)
+        selected[genes] = True
+        position = np.cumsum(selected) - 1
+        prods = np.flatnonzero(selected[index.prod_gene])
+
+        # padded (G, K) regulator arrays, padding is masked out by `valid`
+        self.valid = np.arange(K)[None, :] < counts[:, None]
+        self.reg_species = np.zeros((G, K), dtype=np.int64)
+        self.Kd = np.ones((G, K))
+        self.n = np.ones((G, K))
+        self.activator = np.zeros((G, K), dtype=bool)
+
+        rows, cols = np.nonzero(self.valid)
+        # position of every padded regulator in the GRN.index regulation arrays
+        self.reg_entry = np.full((G, K), -1, dtype=np.int64)
+        self.reg_entry[rows, cols] = regs
+        self.reg_species[rows, cols] = index.reg_species[regs]
+        self.Kd[rows, cols] = index.reg_Kd[regs]
+        self.n[rows, cols] = index.reg_n[regs]
+        self.activator[rows, cols] = index.reg_type[regs] == 1
+
+        self.has_activator = self.activator.any(axis=1)
+        self.first_activator = np.argmax(self.activator, axis=1)
+        self.is_or = index.logic_type[genes] == "or"
+        self.is_first = index.logic_type[genes] == ""
+
+        self.alpha = index.alpha[genes]
+        self.delta = index.delta
+        # product entries, with gene positions within the selection
+        self.prod_gene = position[index.prod_gene[prods]]
+        self.prod_species = index.prod_species[prods]
+
+    def regulator_terms(self, X: np.ndarray) -> np.ndarray:
+        """h = (x / Kd) ** n for every (padded) regulator, shape (B, G, K)"""
+        return (X[..., self.reg_species] / self.Kd) ** self.n
+
+    def gene_activity(self, X: np.ndarray, h: np.ndarray = None) -> np.ndarray:
+        """up / down of every gene, without alpha, shape (B, G)"""
+        if h is None:
+            h = self.regulator_terms(X)
+
+        down = np.prod(np.where(self.valid, 1 + h, 1), axis=-1)
+
+        act = self.activator
+        up_and = np.prod(np.where(act, h, 1), axis=-1)
+        up_or = np.prod(np.where(act, 1 + h, 1), axis=-1) - 1
+        up_first = np.take_along_axis(
+            h, np.broadcast_to(self.first_activator[:, None], h.shape[:-1] + (1,)), -1
+        )[..., 0]
+
+        up = np.where(self.is_or, up_or, np.where(self.is_first, up_first, up_and))
+        up = np.where(self.has_activator, up, 1)
+
+        return up / down
+
+    def production(self, X: np.ndarray) -> np.ndarray:
+        """Total production rate of every species, same shape as X"""
+        X = np.asarray(X, dtype=float)
+        rates = self.alpha * self.gene_activity(X)
+        out = np.zeros(X.shape)
+        np.add.at(out, (..., self.prod_species), rates[..., self.prod_gene])
+        return out
+
+    def degradation(self, X: np.ndarray) -> np.ndarray:
+        return self.delta * X
+
+    def rhs(self, X: np.ndarray) -> np.ndarray:
+        """dX/dt, same as the generated solve_model"""
+        X = np.asarray(X, dtype=float)
+        return self.production(X) - self.degradation(X)
+
+    def solve_model(self, T, state):
+        """Drop-in replacement for the generated model.solve_model"""
+        return self.rhs(state)
+
+    def _derivatives(self, X: np.ndarray):
+        """
+        Activity a of every gene and, per padded regulator, da/dh and the
+        derivatives of h by x, Kd and n. X is a single state of shape (S,).
+        """
+        x = X[self.reg_species]
+        h = (x / self.Kd) ** self.n
+        with np.errstate(divide="ignore", invalid="ignore"):
+            dh_dx = np.where(x > 0, self.n / self.Kd * (x / self.Kd) ** (self.n - 1), 0)
+            dh_dn = np.where(x > 0, h * np.log(x / self.Kd), 0)
+        # limits at x = 0: dh/dx is 1/Kd for n = 1 and 0 for n > 1; for n < 1
+        # the slope is infinite and taken as 0, which is exact for species
+        # held at 0 (e.g. inputs) and keeps the sensitivity equations finite
+        dh_dx = np.where((x == 0) & (self.n == 1), 1 / self.Kd, dh_dx)
+        dh_dx = np.where(self.valid, dh_dx, 0)
+        dh_dn = np.where(self.valid, dh_dn, 0)
+        dh_dKd = np.where(self.valid, -self.n / self.Kd * h, 0)
+
+        a = self.gene_activity(X, h)
+        down = np.prod(np.where(self.valid, 1 + h, 1), axis=-1)
+
+        def others(values):
+            # product over the other regulators of every regulator, (G, K)
+            K = values.shape[-1]
+            tiled = np.where(np.eye(K, dtype=bool), 1, values[:, None, :])
+            return np.prod(tiled, axis=-1)
+
+        act = self.activator
+        dup_and = np.where(act, others(np.where(act, h, 1)), 0)
+        dup_or = np.where(act, others(np.where(act, 1 + h, 1)), 0)
+        dup_first = np.arange(self.K)[None, :] == self.first_activator[:, None]
+        dup = np.where(
+            self.is_or[:, None],
+            dup_or,
+            np.where(self.is_first[:, None], dup_first, dup_and),
+        )
+        dup = np.where(self.has_activator[:, None], dup, 0)
+
+        da_dh = dup / down[:, None] - a[:, None] * np.where(self.valid, 1 / (1 + h), 0)
+        return a, da_dh, dh_dx, dh_dKd, dh_dn
+
+    def jacobian(self, X: np.ndarray) -> np.ndarray:
+        """d(rhs)/dX of a single state X, shape (S, S)"""
+        X = np.asarray(X, dtype=float)
+        _, da_dh, dh_dx, _, _ = self._derivatives(X)
+        S = len(self.delta)
+        J = np.zeros((S, S))
+        # rate of gene g by regulator k, added to every product of g
+        values = (self.alpha[:, None] * da_dh * dh_dx)[self.prod_gene]
+        species = self.reg_species[self.prod_gene]
+        np.add.at(J, (self.prod_species[:, None], species), values)
+        J[np.arange(S), np.arange(S)] -= self.delta
+        return J
+
+    def parameter_jacobian(self, X: np.ndarray):
+        """
+        d(rhs)/d(alpha, Kd, n, delta) of a single state X. Returns a dict of
+        arrays of shape (S, P): alpha by gene (of this HillTerms), Kd and n by
+        entry of the GRN.index regulation arrays, delta by species.
+        """
+        X = np.asarray(X, dtype=float)
+        a, da_dh, _, dh_dKd, dh_dn = self._derivatives(X)
+        S = len(self.delta)
+        n_regs = len(self.index.reg_species)
+        rows = self.prod_species[:, None]
+        entry = np.where(self.valid, self.reg_entry, 0)[self.prod_gene]
+        rate = self.alpha[:, None] * da_dh
+
+        d_alpha = np.zeros((S, len(self.alpha)))
+        np.add.at(d_alpha, (self.prod_species, self.prod_gene), a[self.prod_gene])
+        d_Kd = np.zeros((S, n_regs))
+        np.add.at(d_Kd, (rows, entry), (rate * dh_dKd)[self.prod_gene])
+        d_n = np.zeros((S, n_regs))
+        np.add.at(d_n, (rows, entry), (rate * dh_dn)[self.prod_gene])
+        d_delta = np.diag(-X)
+
+        return {"alpha": d_alpha, "Kd": d_Kd, "n": d_n, "delta": d_delta}
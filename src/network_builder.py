@@ -24,7 +24,16 @@ class Builder:
             self.grn.add_input_species(name)
         return Species(name, delta)
 
-    def gene(self, regulators: list[dict], products: list[Species], alpha: float = 1):
+    def gene(
+        self,
+        regulators: list[dict],
+        products: list[Species],
+        alpha: float = 1,
+        logic_type: str = "and",
+    ):
         self.grn.add_gene(
-            alpha, regulators, [{"name": product.name} for product in products]
+            alpha,
+            regulators,
+            [{"name": product.name} for product in products],
+            logic_type,
         )
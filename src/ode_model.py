@@ -0,0 +1,79 @@
+from typing import Dict, List
+import src.profiling as profiling
+from src.grn import GRN, GRNEvent
+
+
+class ODEModel:
+    """
+    In-memory version of the module written by GRN.generate_model.
+
+    The model subscribes to its GRN: a change re-renders only the equations
+    of the affected species and the function is recompiled on the next call.
+    Instances can be passed as `model` to the simulator functions.
+    """
+
+    def __init__(self, grn: GRN):
+        self.grn = grn
+        # production term of every gene
+        self._terms: List[str] = [GRN.gene_term(gene) for gene in grn.genes]
+        # species -> indices of the genes producing it
+        self._producers: Dict[str, List[int]] = {s: [] for s in grn.species_names}
+        for g, gene in enumerate(grn.genes):
+            for product in gene["products"]:
+                self._producers[product["name"]].append(g)
+
+        self._equations: Dict[str, str] = {}
+        self._dirty = set(grn.species_names)
+        self._solve_model = None
+        self.source = ""
+
+        grn.subscribe(self._on_change)
+
+    def _on_change(self, event: GRNEvent) -> None:
+        gene = event["gene"]
+
+        if event["kind"] == "species_added":
+            self._producers[event["species"][0]] = []
+        elif event["kind"] == "gene_added":
+            self._terms.append(GRN.gene_term(self.grn.genes[gene]))
+            for name in event["species"]:
+                self._producers[name].append(gene)
+        elif gene is not None:
+            self._terms[gene] = GRN.gene_term(self.grn.genes[gene])
+
+        self._dirty.update(event["species"])
+
+    def _equation(self, name: str) -> str:
+        delta = self.grn.species[self.grn.species_index[name]]["delta"]
+        terms = [f"-{name}*{delta}"] + [self._terms[g] for g in self._producers[name]]
+        return "+".join(terms)
+
+    def compile(self) -> None:
+        """Re-render the equations of changed species and recompile the model"""
+        stats = profiling.current()
+        if stats is not None:
+            stats.add("equations_rendered", len(self._dirty))
+
+        for name in self._dirty:
+            self._equations[name] = self._equation(name)
+        self._dirty.clear()
+
+        with profiling.timer(stats, "model_compile"):
+            self.source = GRN.model_source(
+                {name: self._equations[name] for name in self.grn.species_names}
+            )
+            namespace = {}
+            exec(compile(self.source, "<grn model>", "exec"), namespace)
+            self._solve_model = namespace["solve_model"]
+
+    @property
+    def solve_model(self):
+        if self._dirty or self._solve_model is None:
+            self.compile()
+        return self._solve_model
+
+    def __call__(self, T, state):
+        return self.solve_model(T, state)
+
+    def solve_model_steady(self, state):
+        return self.solve_model(0, state)
@@ -0,0 +1,318 @@
+"""
+Knockout and overexpression screens.
+
+A perturbation holds species at fixed values: a knockout ("ko") at 0/False
+and an overexpression ("oe") at a high level/True. Perturbations are applied
+as overrides on one compiled Boolean evaluator (BooleanEvaluator.fix) and one
+vectorized ODE right-hand side (simulator.BatchRHS, with the derivatives of
+fixed species set to zero), so nothing is rebuilt per perturbation.
+
+Both engines are run per input vector, keyed by its binary pattern ("01"):
+the Boolean inputs are fixed to it, and the ODE steady states are relaxed
+from n_starts random initial states and deduplicated, so multistable
+perturbations report every steady state that was reached.
+"""
+
+import itertools
+import numpy as np
+from typing import List, Literal, Optional, Sequence, Tuple
+import src.profiling as profiling
+from src.bool_eval import BooleanEvaluator
+from src.grn import GRN
+from src.hill import HillTerms
+from src.simulator import BatchRHS, steady_batch
+
+PerturbationKind = Literal["ko", "oe"]
+Perturbation = Tuple[Tuple[str, PerturbationKind], ...]
+
+
+def enumerate_perturbations(
+    species: Sequence[str],
+    kinds: Sequence[PerturbationKind] = ("ko", "oe"),
+    max_size: int = 2,
+) -> List[Perturbation]:
+    """All combinations of up to max_size perturbations of different species"""
+    result: List[Perturbation] = [()]
+    for size in range(1, max_size + 1):
+        for names in itertools.combinations(species, size):
+            for combination in itertools.product(kinds, repeat=size):
+                result.append(tuple(zip(names, combination)))
+    return result
+
+
+def _input_key(X0) -> str:
+    return "".join(str(int(x > 0)) for x in X0)
+
+
+def _distinct(states: np.ndarray, tol: float) -> List[np.ndarray]:
+    """
+    Distinct states, a state within tol (max norm, relative to the state's
+    magnitude when above 1) of an earlier one counts as that state, as in
+    simulator.get_multistable
+    """
+    centers = []
+    for state in states:
+        if not any(
+            np.max(np.abs(state - c) / np.maximum(np.abs(c), 1)) < tol for c in centers
+        ):
+            centers.append(state)
+    return centers
+
+
+def label(perturbation: Perturbation) -> str:
+    """ "Y1:ko,Y2:oe", or "wt" for the unperturbed network"""
+    if not perturbation:
+        return "wt"
+    return ",".join(f"{name}:{kind}" for name, kind in perturbation)
+
+
+class _Screen:
+    """Compiled models of one GRN, shared by all perturbations of a screen"""
+
+    def __init__(
+        self,
+        grn: GRN,
+        boolean: bool,
+        ode: bool,
+        mode: str,
+        INS: np.ndarray,
+        R0: np.ndarray,
+        oe_level: float,
+        eps: float,
+        tol: float,
+        max_time: float,
+        max_variables: int,
+    ):
+        from src.bool_sim import BooleanNetwork
+
+        self.grn = grn
+        self.mode = mode
+        self.INS = INS
+        self.R0 = R0
+        self.oe_level = oe_level
+        self.eps = eps
+        self.tol = tol
+        self.max_time = max_time
+        self.max_variables = max_variables
+
+        self.bn = BooleanNetwork(grn) if boolean else None
+        self.ev = BooleanEvaluator(self.bn.boolean_rules) if boolean else None
+        self.hill = HillTerms(grn) if ode else None
+
+    def boolean_rows(self, perturbation: Perturbation) -> List[dict]:
+        names = self.bn.original_names
+        rows = []
+        for key in dict.fromkeys(_input_key(X0) for X0 in self.INS):
+            # inputs fixed to the input vector, perturbations take precedence
+            values = {
+                names[name]: bit == "1"
+                for name, bit in zip(self.grn.input_species_names, key)
+            }
+            values.update({names[name]: kind == "oe" for name, kind in perturbation})
+            base = {
+                "perturbation": label(perturbation),
+                "engine": "boolean",
+                "input": key,
+            }
+            try:
+                attractors = self.ev.fix(values).attractors(
+                    self.mode, self.max_variables
+                )
+            except ValueError as e:
+                # too many free variables, the other perturbations may still fit
+                rows.append({**base, "error": f"{type(e).__name__}: {e}"})
+                continue
+
+            for i, states in enumerate(attractors):
+                row = {
+                    **base,
+                    "attractor": i,
+                    "kind": "steady" if len(states) == 1 else "cyclic",
+                    "n_states": len(states),
+                    "error": None,
+                }
+                # activity of every species, averaged over the attractor states
+                row.update(zip(self.grn.species_names, states.mean(axis=0).tolist()))
+                rows.append(row)
+        return rows
+
+    def ode_rows(self, perturbation: Perturbation) -> List[dict]:
+        fixed = np.array(
+            [self.grn.species_index[name] for name, _ in perturbation], dtype=np.int64
+        )
+        # every input vector from every random initial state, in one batch
+        n_starts = len(self.R0)
+        S0 = np.column_stack(
+            [
+                np.repeat(self.INS, n_starts, axis=0),
+                np.tile(self.R0, (len(self.INS), 1)),
+            ]
+        )
+        S0[:, fixed] = [
+            self.oe_level if kind == "oe" else 0.0 for _, kind in perturbation
+        ]
+        steady, converged = steady_batch(
+            BatchRHS(self.hill, fixed, len(S0)), S0, self.eps, self.max_time
+        )
+        steady = steady.reshape(len(self.INS), n_starts, -1)
+        converged = converged.reshape(len(self.INS), n_starts)
+
+        rows = []
+        for X0, states, ok in zip(self.INS, steady, converged):
+            base = {
+                "perturbation": label(perturbation),
+                "engine": "ode",
+                "input": _input_key(X0),
+                "n_states": 1,
+            }
+            for i, state in enumerate(_distinct(states[ok], self.tol)):
+                row = {**base, "attractor": i, "kind": "steady", "error": None}
+                row.update(zip(self.grn.species_names, state.tolist()))
+                rows.append(row)
+            if not ok.all():
+                # e.g. an oscillation, there is no steady level to report
+                row = {
+                    **base,
+                    "attractor": None,
+                    "kind": "unconverged",
+                    "error": f"{n_starts - ok.sum()} of {n_starts} starts did "
+                    f"not converge within {self.max_time}",
+                }
+                row.update(dict.fromkeys(self.grn.species_names, np.nan))
+                rows.append(row)
+        return rows
+
+    def __call__(self, perturbation: Perturbation) -> List[dict]:
+        rows = []
+        if self.ev is not None:
+            rows += self.boolean_rows(perturbation)
+        if self.hill is not None:
+            rows += self.ode_rows(perturbation)
+        return rows
+
+
+# compiled models of a worker process, built once by the pool initializer
+_worker: Optional[_Screen] = None
+
+
+def _init_worker(*args):
+    global _worker
+    _worker = _Screen(*args)
+
+
+def _run_worker(perturbation: Perturbation) -> List[dict]:
+    return _worker(perturbation)
+
+
+@profiling.instrumented
+def screen(
+    grn: GRN,
+    perturbations: Optional[List[Perturbation]] = None,
+    boolean: bool = True,
+    ode: bool = True,
+    mode: Literal["async", "sync"] = "async",
+    INS_def=False,
+    INS_factor=1,
+    oe_level: Optional[float] = None,
+    eps: float = 10 ** (-3),
+    n_starts: int = 10,
+    tol: float = 10 ** (-2),
+    max_time: float = 1000,
+    max_variables: int = 20,
+    processes: Optional[int] = None,
+    seed=None,
+):
+    """
+    Attractors and ODE steady states of a GRN under every perturbation.
+
+    Parameters:
+    perturbations: list of perturbations, each a tuple of (species, "ko" | "oe")
+        pairs; by default the unperturbed network ("wt") and every single and
+        double knockout and overexpression of the regulated species
+    boolean, ode: which engines to run
+    mode: Boolean update mode, attractors are enumerated exactly over the
+        variables that are not fixed (at most max_variables of them)
+    INS_def, INS_factor: input vectors, as in get_steady; the Boolean inputs
+        are fixed to their binary pattern (on where the level is above 0)
+    oe_level: level of overexpressed species in the ODE model, 10 times the
+        largest Kd of the network by default
+    eps: convergence threshold of the ODE steady states
+    n_starts: random initial states of the ODE steady states, per input
+    tol: ODE steady states closer than tol are the same state, as in
+        get_multistable
+    max_time: longest integration of the ODE steady states; starts that have
+        not converged by then (e.g. oscillations) are reported in one row of
+        kind "unconverged" with NaN levels
+    processes: run perturbations in a process pool of this size
+    seed: seed of the random initial states, shared by all perturbations
+
+    Returns a DataFrame with one row per Boolean attractor and per distinct
+    ODE steady state of every input vector: perturbation, engine, input
+    (binary input vector), attractor, kind, n_states, error and the level of
+    every species (for Boolean attractors, the fraction of attractor states
+    in which it is on). An input whose Boolean attractors cannot be
+    enumerated (more than max_variables free variables) gets one row with
+    only the error set.
+    """
+    import pandas as pd
+
+    index = grn.index
+    n_INS = len(grn.input_species_names)
+    n_RS = len(grn.species_names) - n_INS
+
+    if perturbations is None:
+        regulated = [
+            s for s, inp in zip(index.species_names, index.is_input) if not inp
+        ]
+        perturbations = enumerate_perturbations(regulated)
+
+    if INS_def:
+        INS = np.array(INS_def, dtype=float)
+    else:
+        from src.simulator import generate_bin_vectors
+
+        INS = generate_bin_vectors(n_INS) * INS_factor
+    R0 = np.random.default_rng(seed).random((n_starts, n_RS))
+    if oe_level is None:
+        oe_level = 10 * float(index.reg_Kd.max()) if len(index.reg_Kd) else 1.0
+
+    args = (
+        grn,
+        boolean,
+        ode,
+        mode,
+        INS,
+        R0,
+        oe_level,
+        eps,
+        tol,
+        max_time,
+        max_variables,
+    )
+
+    stats = profiling.current()
+    if stats is not None:
+        stats.add("perturbations", len(perturbations))
+
+    if processes is None or processes <= 1:
+        run = _Screen(*args)
+        results = [run(p) for p in perturbations]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(
+            processes, initializer=_init_worker, initargs=args
+        ) as pool:
+            results = list(pool.map(_run_worker, perturbations))
+
+    rows = [row for result in results for row in result]
+    columns = [
+        "perturbation",
+        "engine",
+        "input",
+        "attractor",
+        "kind",
+        "n_states",
+        "error",
+    ]
+    return pd.DataFrame(rows, columns=columns + list(grn.species_names))
@@ -0,0 +1,145 @@
+"""
+Opt-in counters and timers for the simulation engines.
+
+Instrumentation is off by default. It is switched on inside a profile()
+block, or globally with enable():
+
+    with profiling.profile() as stats:
+        simulator.simulate_single(grn, IN, plot_on=False)
+        bool_network.find_attractors()
+    print(stats)
+
+Every instrumented call also leaves its own Stats in `last_stats` (the
+simulator module, BooleanNetwork and QualModel instances). When
+instrumentation is disabled the engines only pay for a single check.
+"""
+
+import sys
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from time import perf_counter
+from typing import Dict, List
+
+
+class Stats:
+    def __init__(self):
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.times: Dict[str, float] = defaultdict(float)
+
+    def add(self, name: str, n: int = 1) -> None:
+        self.counts[name] += n
+
+    @contextmanager
+    def timer(self, name: str):
+        """Time a block, also counting how many times it ran"""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.times[name] += perf_counter() - start
+            self.counts[name] += 1
+
+    def update(self, other: "Stats") -> None:
+        for name, n in other.counts.items():
+            self.counts[name] += n
+        for name, t in other.times.items():
+            self.times[name] += t
+
+    def as_dict(self) -> Dict[str, Dict]:
+        return {"counts": dict(self.counts), "times": dict(self.times)}
+
+    def __repr__(self):
+        lines = ["Stats:"]
+        for name in sorted(set(self.counts) | set(self.times)):
+            line = f"  {name:<24} {self.counts.get(name, 0):>10}"
+            if name in self.times:
+                line += f" {self.times[name]:>10.4f}s"
+            lines.append(line)
+        return "\n".join(lines)
+
+
+# open Stats, innermost last; a finished call is merged into its parent
+_stack: List[Stats] = []
+_enabled = False
+
+
+def enable(on: bool = True) -> None:
+    """Switch instrumentation on (or off) outside of profile() blocks"""
+    global _enabled
+    _enabled = on
+
+
+def enabled() -> bool:
+    return _enabled or bool(_stack)
+
+
+def current() -> Stats | None:
+    """Stats of the innermost instrumented call, None when disabled"""
+    return _stack[-1] if _stack else None
+
+
+def _close(stats: Stats) -> None:
+    _stack.remove(stats)
+    if _stack:
+        _stack[-1].update(stats)
+
+
+@contextmanager
+def profile():
+    """Aggregate the stats of every instrumented call inside the block"""
+    stats = Stats()
+    _stack.append(stats)
+    try:
+        yield stats
+    finally:
+        _close(stats)
+
+
+def instrumented(func):
+    """
+    Give every call of func its own Stats while instrumentation is enabled.
+
+    The stats of the last call are stored as `last_stats` on the instance for
+    methods and on the defining module for plain functions.
+    """
+    is_method = "." in func.__qualname__
+    module = sys.modules[func.__module__]
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not enabled():
+            return func(*args, **kwargs)
+
+        stats = Stats()
+        _stack.append(stats)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _close(stats)
+            if is_method:
+                args[0].last_stats = stats
+            else:
+                module.last_stats = stats
+
+    return wrapper
+
+
+def timer(stats: Stats | None, name: str):
+    return nullcontext() if stats is None else stats.timer(name)
+
+
+def timed(func, stats: Stats | None, name: str):
+    """Wrap func so that every call is counted and timed under name"""
+    if stats is None:
+        return func
+
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stats.times[name] += perf_counter() - start
+            stats.counts[name] += 1
+
+    return wrapper
@@ -1,10 +1,11 @@
 import libsbml
-import networkx as nx
 import numexpr as ne
 from itertools import product
 from typing import TypedDict
 from collections import defaultdict
 import src.utils as utils
+import src.profiling as profiling
+from src.trajectory import Trajectory, encoder, simulate_deterministic
 
 
 class FunctionTerm(TypedDict):
@@ -39,6 +40,8 @@ class QualModel:
         self.model = model
         self.species = [s.getId() for s in self.model.getListOfQualitativeSpecies()]
         self.transitions, self.max_levels = self._parse_transitions()
+        # stats of the last instrumented call, see src.profiling
+        self.last_stats = None
 
     def _parse_transitions(self):
         transitions = []
@@ -95,7 +98,9 @@ class QualModel:
         for state in product(*ranges):
             yield dict(zip(self.species, state))
 
+    @profiling.instrumented
     def find_attractors(self):
+        stats = profiling.current()
         visited = set()
         steady_states = set()
         cyclic_attractors = set()
@@ -113,6 +118,8 @@ class QualModel:
             hashable = to_hashable(state)
             if hashable in visited:
                 continue
+            if stats is not None:
+                stats.add("states_expanded")
             cycle = find_cycle(state)
             visited.update(hashable)
             if len(cycle) == 1:
@@ -127,20 +134,22 @@ class QualModel:
             ],
         }
 
-    def plot_state_transitions(self, ax=None):
-        attractors = self.find_attractors()
-
+    def plot_state_transitions(self, ax=None, **kwargs):
         def node_name(state):
             return "".join(f"{state[s]}" for s in self.species)
 
+        import networkx as nx
+
         edges = [(node_name(s), node_name(self.step(s))) for s in self._all_states()]
 
         G = nx.DiGraph()
         G.add_edges_from(edges)
 
-        utils.plot_state_transitions(G, attractors, node_name, ax)
+        utils.plot_state_transitions(G, ax=ax, **kwargs)
 
     def plot_interaction_graph(self, ax=None):
+        import networkx as nx
+
         G = nx.MultiDiGraph()
         for t in self.transitions:
             for term in t["function_terms"]:
@@ -155,11 +164,16 @@ class QualModel:
         if isinstance(state, tuple):
             state = dict(zip(self.species, state))
 
+        stats = profiling.current()
+        evaluate = profiling.timed(ne.evaluate, stats, "numexpr_evals")
+        if stats is not None:
+            stats.add("step_calls")
+
         next_state = {}
         for t in self.transitions:
             inputs = [state[i] for i in t["inputs"]]
             for f in t["function_terms"]:
-                if ne.evaluate(f["math"], local_dict=dict(zip(t["inputs"], inputs))):
+                if evaluate(f["math"], local_dict=dict(zip(t["inputs"], inputs))):
                     for s in t["outputs"]:
                         next_state[s] = f["result_level"]
                     break
@@ -173,11 +187,18 @@ class QualModel:
 
         return next_state
 
-    def simulate(
-        self, initial_state: dict[str, int], steps: int
-    ) -> list[dict[str, int]]:
-        trajectory = [initial_state]
-        for _ in range(steps):
-            next_state = self.step(trajectory[-1])
-            trajectory.append(next_state)
+    @profiling.instrumented
+    def simulate(self, initial_state: dict[str, int], steps: int) -> Trajectory:
+        """
+        Synchronous simulation for `steps` steps. The simulation stops at the
+        first repeated state, the returned Trajectory stores the transient and
+        one period of the cycle and expands to steps + 1 states on demand.
+        """
+        radix = max([*self.max_levels.values(), *initial_state.values(), 0]) + 1
+        trajectory = simulate_deterministic(
+            self.step, initial_state, steps, encoder(self.species, radix)
+        )
+        stats = profiling.current()
+        if stats is not None:
+            stats.add("states_visited", len(trajectory.transient) + trajectory.period)
         return trajectory
@@ -0,0 +1,174 @@
+"""
+Reduction of the ODE model before integration.
+
+- input species are parameters, not state variables
+- species outside the upstream cone of the requested outputs are dropped
+- species with fast degradation can be put in quasi-steady state (QSSA)
+
+The reduced system is integrated and the results are expanded back to the
+full state vector in GRN.species_names order. Dropped species cannot be
+recovered without integrating them and are returned as NaN.
+"""
+
+import numpy as np
+from typing import List, Optional
+import src.profiling as profiling
+from src.grn import GRN
+from src.hill import HillTerms
+
+
+def upstream_cone(grn: GRN, outputs: List[str]) -> np.ndarray:
+    """Boolean mask of species that (transitively) regulate any of the outputs"""
+    index = grn.index
+    edges = index.regulation_edges()
+
+    # regulators of every species
+    order = np.argsort(edges[:, 1], kind="stable")
+    regs, targets = edges[order, 0], edges[order, 1]
+    ptr = np.searchsorted(targets, np.arange(index.n_species + 1))
+
+    keep = np.zeros(index.n_species, dtype=bool)
+    stack = [grn.species_index[name] for name in outputs]
+    keep[stack] = True
+    while stack:
+        s = stack.pop()
+        for r in regs[ptr[s] : ptr[s + 1]]:
+            if not keep[r]:
+                keep[r] = True
+                stack.append(r)
+    return keep
+
+
+def qssa_candidates(grn: GRN, species: np.ndarray, ratio: float = 10.0) -> np.ndarray:
+    """
+    Indices of species whose degradation rate is at least `ratio` times the
+    median of the given species and that do not regulate themselves.
+    """
+    index = grn.index
+    delta = index.delta[species]
+    if len(species) == 0:
+        return species
+
+    edges = index.regulation_edges()
+    self_regulated = np.unique(edges[edges[:, 0] == edges[:, 1], 0])
+
+    fast = delta >= ratio * np.median(delta)
+    return species[fast & ~np.isin(species, self_regulated)]
+
+
+class ReducedModel:
+    """
+    Reduced right-hand side for a fixed input vector.
+
+    Parameters:
+    grn: the network
+    IN: input levels, in GRN.input_species_names order
+    outputs: species of interest, all regulated species when None
+    qssa: put fast species (see qssa_candidates) in quasi-steady state
+    qssa_ratio: delta ratio to the median delta that counts as fast
+    qssa_iterations: fixed-point iterations for the QSSA species per evaluation
+    """
+
+    def __init__(
+        self,
+        grn: GRN,
+        IN,
+        outputs: Optional[List[str]] = None,
+        qssa: bool = False,
+        qssa_ratio: float = 10.0,
+        qssa_iterations: int = 10,
+    ):
+        index = grn.index
+        self.grn = grn
+
+        regulated = np.flatnonzero(~index.is_input)
+        if outputs is None:
+            keep = ~index.is_input
+        else:
+            keep = upstream_cone(grn, outputs) & ~index.is_input
+        self.kept = np.flatnonzero(keep)
+        self.pruned = np.setdiff1d(regulated, self.kept)
+
+        # only the genes producing kept species are evaluated
+        genes = np.unique(index.prod_gene[keep[index.prod_species]])
+        self.hill = HillTerms(index, genes)
+
+        self.qssa_candidates = qssa_candidates(grn, self.kept, qssa_ratio)
+        self.fast = self.qssa_candidates if qssa else np.empty(0, dtype=np.int64)
+        self.state = np.setdiff1d(self.kept, self.fast)
+        self.qssa_iterations = qssa_iterations
+
+        self.inputs = np.flatnonzero(index.is_input)
+        self.x = np.full(index.n_species, np.nan)
+        self.x[self.inputs] = np.array(IN, dtype=float)
+        self.x[self.fast] = 0.0
+
+    @property
+    def n_state(self) -> int:
+        return len(self.state)
+
+    def _fill_fast(self, x: np.ndarray) -> None:
+        # x_f = production_f(x) / delta_f, iterated from the last value
+        delta = self.hill.delta[self.fast]
+        for _ in range(self.qssa_iterations):
+            x[..., self.fast] = self.hill.production(x)[..., self.fast] / delta
+
+    def expand(self, y: np.ndarray) -> np.ndarray:
+        """Full state vector(s) from reduced state(s) y, pruned species are NaN"""
+        y = np.asarray(y, dtype=float)
+        x = np.broadcast_to(self.x, y.shape[:-1] + self.x.shape).copy()
+        x[..., self.state] = y
+        if len(self.fast):
+            self._fill_fast(x)
+        return x
+
+    def reduce(self, x: np.ndarray) -> np.ndarray:
+        """Reduced state from a full state vector"""
+        return np.asarray(x, dtype=float)[..., self.state]
+
+    def __call__(self, T, y):
+        x = self.x
+        x[self.state] = y
+        if len(self.fast):
+            self._fill_fast(x)
+        return self.hill.rhs(x)[self.state]
+
+
+@profiling.instrumented
+def simulate_reduced(
+    grn: GRN,
+    IN,
+    outputs: Optional[List[str]] = None,
+    INS_factor=1,
+    t_end=100,
+    R0=False,
+    qssa: bool = False,
+    qssa_ratio: float = 10.0,
+):
+    """
+    Like simulator.simulate_single, but integrates the reduced system.
+
+    Returns T, Y and the ReducedModel, Y has the full state in
+    GRN.species_names order with NaN for the pruned species.
+    """
+    from src.simulator import solve
+
+    n_INS = len(grn.input_species_names)
+    n_RS = len(grn.species_names) - n_INS
+
+    X0 = np.array(IN) * INS_factor
+    if type(R0) is bool:
+        R0 = np.random.random(n_RS)
+
+    model = ReducedModel(grn, X0, outputs, qssa=qssa, qssa_ratio=qssa_ratio)
+    S0 = np.append(X0, R0)
+
+    stats = profiling.current()
+    if stats is not None:
+        stats.add("state_dimension", model.n_state)
+
+    sol = solve(model, [0, t_end], model.reduce(S0))
+    T = np.arange(0, t_end + 1)
+    Y = model.expand(sol.sol(T).T)
+
+    return T, Y, model
@@ -0,0 +1,181 @@
+"""
+Forward sensitivity analysis of the ODE model.
+
+The sensitivities S = dX/dtheta of all species to the parameters theta obey
+
+    dS/dt = J(X) S + F(X),    S(0) = 0
+
+with J = d(rhs)/dX and F = d(rhs)/dtheta given exactly by the Hill structure
+(HillTerms.jacobian and HillTerms.parameter_jacobian). They are integrated
+together with the state, so one integration gives the whole dX/dtheta matrix
+instead of two simulations per parameter.
+"""
+
+import numpy as np
+from typing import List, Sequence, Tuple
+import src.profiling as profiling
+from src.grn import GRN, GRNIndex
+from src.hill import HillTerms
+
+
+def parameter_names(
+    grn: GRN, kinds: Sequence[str] = ("alpha", "Kd", "n")
+) -> List[Tuple]:
+    """
+    Names of the parameters, in the order of the sensitivity columns:
+    ("alpha", gene), ("Kd", gene, regulator), ("n", gene, regulator) and
+    ("delta", species). Input species have no delta parameter.
+    """
+    index = grn.index
+    names = []
+    for kind in kinds:
+        if kind == "alpha":
+            names += [("alpha", g) for g in range(index.n_genes)]
+        elif kind in ("Kd", "n"):
+            names += [
+                (kind, int(g), index.species_names[s])
+                for g, s in zip(index.reg_gene, index.reg_species)
+            ]
+        elif kind == "delta":
+            names += [
+                ("delta", name)
+                for name, inp in zip(index.species_names, index.is_input)
+                if not inp
+            ]
+        else:
+            raise ValueError(f"Invalid parameter kind {kind}")
+    return names
+
+
+def parameter_values(
+    grn: GRN | GRNIndex, kinds: Sequence[str] = ("alpha", "Kd", "n")
+) -> np.ndarray:
+    """Current values of the parameters, in parameter_names order"""
+    index = grn.index if isinstance(grn, GRN) else grn
+    arrays = {
+        "alpha": index.alpha,
+        "Kd": index.reg_Kd,
+        "n": index.reg_n,
+        "delta": index.delta[~index.is_input],
+    }
+    return np.concatenate([arrays[kind] for kind in kinds] + [np.empty(0)])
+
+
+def _name_columns(names: List[Tuple]) -> dict:
+    """parameter, gene and species columns of parameter names"""
+    return {
+        "parameter": [name[0] for name in names],
+        "gene": [name[1] if name[0] != "delta" else None for name in names],
+        "species": [
+            name[2] if len(name) == 3 else (name[1] if name[0] == "delta" else None)
+            for name in names
+        ],
+    }
+
+
+class SensitivitySystem:
+    """Right-hand side of the state and its sensitivities, flattened for solve_ivp"""
+
+    def __init__(
+        self, grn: GRN | GRNIndex, kinds: Sequence[str] = ("alpha", "Kd", "n")
+    ):
+        self.hill = HillTerms(grn)
+        self.kinds = list(kinds)
+        self.regulated = ~self.hill.index.is_input
+        self.S = len(self.hill.delta)
+        self.P = len(parameter_values(grn, kinds))
+
+    def parameter_jacobian(self, X: np.ndarray) -> np.ndarray:
+        F = self.hill.parameter_jacobian(X)
+        F["delta"] = F["delta"][:, self.regulated]
+        return np.concatenate(
+            [F[kind] for kind in self.kinds] + [np.empty((self.S, 0))], axis=1
+        )
+
+    def split(self, z: np.ndarray):
+        return z[..., : self.S], z[..., self.S :].reshape(
+            z.shape[:-1] + (self.S, self.P)
+        )
+
+    def __call__(self, T, z):
+        X, dX = self.split(z)
+        J = self.hill.jacobian(X)
+        ddX = J @ dX + self.parameter_jacobian(X)
+        return np.concatenate([self.hill.rhs(X), ddX.ravel()])
+
+
+@profiling.instrumented
+def simulate_sensitivity(
+    grn: GRN,
+    IN,
+    parameters: Sequence[str] = ("alpha", "Kd", "n"),
+    INS_factor=1,
+    t_end=100,
+    R0=False,
+    rtol: float = 1e-6,
+    atol: float = 1e-9,
+):
+    """
+    Like simulator.simulate_single, but also integrates the sensitivities of
+    every species to the parameters.
+
+    Parameters:
+    parameters: kinds of parameters, any of "alpha", "Kd", "n" and "delta"
+    rtol, atol: solver tolerances, tighter than the simulator defaults as
+        sensitivities are small differences of states
+
+    Returns T, Y, dY and the parameter names: Y has shape (len(T), S) and
+    dY = dY/dtheta has shape (len(T), S, P), columns in parameter_names order.
+    """
+    from src.simulator import solve
+
+    n_INS = len(grn.input_species_names)
+    n_RS = len(grn.species_names) - n_INS
+
+    X0 = np.array(IN) * INS_factor
+    if type(R0) is bool:
+        R0 = np.random.random(n_RS)
+    S0 = np.append(X0, R0)
+
+    system = SensitivitySystem(grn, parameters)
+    z0 = np.concatenate([S0, np.zeros(system.S * system.P)])
+
+    stats = profiling.current()
+    if stats is not None:
+        stats.add("sensitivity_dimension", len(z0))
+
+    sol = solve(system, [0, t_end], z0, rtol=rtol, atol=atol)
+    T = np.arange(0, t_end + 1)
+    Y, dY = system.split(sol.sol(T).T)
+    return T, Y, dY, parameter_names(grn, parameters)
+
+
+def rank_parameters(
+    grn: GRN,
+    Y: np.ndarray,
+    dY: np.ndarray,
+    parameters: Sequence[str] = ("alpha", "Kd", "n"),
+    species: Sequence[str] = None,
+):
+    """
+    Parameters ranked by their normalized sensitivity
+    max over time of |theta / y * dy/dtheta|, over the given species (all
+    regulated species by default). Returns a DataFrame sorted by sensitivity.
+    """
+    import pandas as pd
+
+    index = grn.index
+    if species is None:
+        columns = np.flatnonzero(~index.is_input)
+    else:
+        columns = np.array([grn.species_index[s] for s in species])
+
+    theta = parameter_values(grn, parameters)
+    y = np.abs(Y[:, columns, None])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        normalized = np.where(y > 0, np.abs(dY[:, columns, :]) * theta / y, 0)
+    score = normalized.max(axis=(0, 1))
+
+    names = parameter_names(grn, parameters)
+    df = pd.DataFrame({**_name_columns(names), "value": theta, "sensitivity": score})
+    return df.sort_values("sensitivity", ascending=False, ignore_index=True)
@@ -1,10 +1,19 @@
+from __future__ import annotations
+
 import numpy as np
 import importlib
-import matplotlib.pyplot as plt
-from matplotlib import axes
-from scipy.integrate import solve_ivp
-import pandas as pd
 import os
+from typing import TYPE_CHECKING
+import src.cache as cache
+import src.profiling as profiling
+
+# matplotlib, pandas and scipy are imported lazily inside the functions that
+# use them, so that importing the simulator stays cheap in worker processes
+if TYPE_CHECKING:
+    from matplotlib import axes
+
+# stats of the last instrumented call, see src.profiling
+last_stats = None
 
 
 def generate_bin_vectors(INS_num):
@@ -18,9 +27,12 @@ def generate_bin_vectors(INS_num):
     return np.array(vects)
 
 
-def get_steady(
-    grn, model=False, rep_num=1, INS_def=False, INS_factor=1, eps=10 ** (-3)
-):
+def _load_model(grn, model):
+    """
+    Resolve the model argument of the simulator functions to a solve_model
+    function: False generates model.py from the GRN, a string names a module
+    to import and anything else is used as is.
+    """
     if type(model) is bool:
         grn.generate_model()
         model = "model"
@@ -29,7 +41,116 @@ def get_steady(
         model_module = importlib.import_module(model.replace(os.sep, "."))
         model_module = importlib.reload(model_module)
         model = model_module.solve_model
+    return model
+
+
+def _cacheable(grn, model) -> bool:
+    """Results are cached only for models derived from the GRN itself"""
+    from src.ode_model import ODEModel
 
+    return type(model) is bool or (isinstance(model, ODEModel) and model.grn is grn)
+
+
+def solve(model, t_span, y0, **options):
+    """
+    solve_ivp with LSODA, counts RHS evaluations and steps when profiling.
+    options (rtol, atol, ...) are passed on to solve_ivp.
+    """
+    from scipy.integrate import solve_ivp
+
+    stats = profiling.current()
+    with profiling.timer(stats, "solve_ivp"):
+        sol = solve_ivp(
+            profiling.timed(model, stats, "rhs_evals"),
+            t_span,
+            y0,
+            dense_output=True,
+            method="LSODA",
+            **options,
+        )  # gre za stiff problem, uporaba LSODA
+
+    if stats is not None:
+        stats.add("solver_steps", len(sol.t) - 1)
+        stats.add("jacobian_evals", int(sol.njev))
+
+    return sol
+
+
+class BatchRHS:
+    """
+    Right-hand side of a batch of states of a HillTerms model, flattened for
+    solve, with the species in `fixed` held constant
+    """
+
+    def __init__(self, hill, fixed: np.ndarray, batch: int):
+        self.hill = hill
+        self.fixed = fixed
+        self.shape = (batch, len(hill.delta))
+
+    def __call__(self, T, state):
+        dX = self.hill.rhs(state.reshape(self.shape))
+        dX[:, self.fixed] = 0
+        return dX.ravel()
+
+
+def steady_batch(model: BatchRHS, S0: np.ndarray, eps: float, max_time: float = 1000):
+    """
+    Steady states of a batch of initial states (B, S), integrated together
+    with the same stopping rule as get_steady_single, for at most max_time
+    time units so that oscillating states cannot hang the caller.
+
+    Returns the final states and whether each of them converged.
+    """
+    y = S0.ravel()
+    T = np.arange(0, 1.1, 0.1)
+    for _ in range(max(int(np.ceil(max_time)), 1)):
+        Y = solve(model, [0, 1], y).sol(T).T
+        change = np.abs(Y[-2] - Y[-1]).reshape(model.shape).max(axis=1)
+        converged = change < eps
+        y = Y[-1]
+        if converged.all():
+            break
+    return y.reshape(model.shape), converged
+
+
+def _steady_trajectory(solve_model, S0, eps) -> np.ndarray:
+    """
+    States of S0 integrated in steps of one time unit, until the change over
+    the last 0.1 time units is below eps
+    """
+    states = [S0]
+
+    t_step = 1
+    dt = 0.1
+    T = np.arange(0, t_step + dt, dt)
+
+    while True:
+        sol = solve(solve_model, [0, t_step], states[-1])
+        z = sol.sol(T)
+        Y = z.T
+
+        if np.max(np.abs(Y[-2] - Y[-1])) < eps:
+            break
+
+        states.append(Y[-1])
+    return np.array(states)
+
+
+@profiling.instrumented
+def get_steady(
+    grn,
+    model=False,
+    rep_num=1,
+    INS_def=False,
+    INS_factor=1,
+    eps=10 ** (-3),
+    seed=None,
+):
+    """
+    Steady states of every input vector from rep_num random initial states.
+    Results are cached (see src.cache) only with a seed, as random initial
+    states must not be frozen.
+    """
     n_INS = len(grn.input_species_names)
     n_RS = len(grn.species_names) - n_INS
 
@@ -38,21 +159,117 @@ def get_steady(
     else:
         INS = generate_bin_vectors(n_INS) * INS_factor
 
-    STATES = []
-
-    for _ in range(rep_num):
-        R0 = np.random.random(n_RS)
+    def compute():
+        solve_model = _load_model(grn, model)
+        rng = np.random if seed is None else np.random.default_rng(seed)
+        STATES = []
+
+        for _ in range(rep_num):
+            R0 = rng.random(n_RS)
+
+            for X0 in INS:
+                S0 = np.append(np.array(X0), R0)
+                STATES.append(_steady_trajectory(solve_model, S0, eps)[-1])
+        return np.array(STATES)
+
+    if seed is not None and _cacheable(grn, model):
+        STATES = cache.cached(
+            "steady",
+            grn,
+            compute,
+            INS=np.asarray(INS),
+            rep_num=rep_num,
+            eps=eps,
+            seed=seed,
+        )
+    else:
+        STATES = compute()
 
-        for X0 in INS:
-            states = get_steady_single(grn, model, X0, plot_on=False, eps=eps, R0=R0)
-            STATES.append(states[-1])
+    import pandas as pd
 
     df = pd.DataFrame(STATES)
     df.columns = grn.species_names
+    df.attrs["stats"] = profiling.current()
+
+    return df
+
+
+@profiling.instrumented
+def get_multistable(
+    grn,
+    model=False,
+    INS_def=False,
+    INS_factor=1,
+    patience=10,
+    max_restarts=200,
+    tol=10 ** (-2),
+    eps=10 ** (-3),
+):
+    """
+    Distinct steady states per input vector, found from random restarts.
+
+    Every restart relaxes a random initial state with the stopping rule of
+    get_steady_single (integrating until the change falls below eps), and
+    the final states are clustered: a state within `tol` (max norm, relative
+    to the state's magnitude when above 1) of a known steady state counts as
+    that state. Restarts for an input stop once
+    `patience` consecutive restarts found no new steady state, or after
+    `max_restarts`.
+
+    Returns a DataFrame with one row per input and steady state: the species
+    columns plus "input" (index into the input vectors), "count" (restarts
+    that ended in the state), "basin_fraction" and "restarts".
+    """
+    model = _load_model(grn, model)
+
+    n_INS = len(grn.input_species_names)
+    n_RS = len(grn.species_names) - n_INS
+
+    if INS_def:
+        INS = INS_def
+    else:
+        INS = generate_bin_vectors(n_INS) * INS_factor
+
+    rows = []
+    for i, X0 in enumerate(INS):
+        centers = []
+        counts = []
+        since_new = 0
+        restarts = 0
+
+        while since_new < patience and restarts < max_restarts:
+            R0 = np.random.random(n_RS)
+            state = _steady_trajectory(model, np.append(np.array(X0), R0), eps)[-1]
+            restarts += 1
+            since_new += 1
+
+            for j, center in enumerate(centers):
+                scale = np.maximum(np.abs(center), 1)
+                if np.max(np.abs(state - center) / scale) < tol:
+                    counts[j] += 1
+                    # running mean of the cluster
+                    centers[j] = center + (state - center) / counts[j]
+                    break
+            else:
+                centers.append(np.array(state))
+                counts.append(1)
+                since_new = 0
+
+        for center, count in zip(centers, counts):
+            rows.append(list(center) + [i, count, count / restarts, restarts])
+
+    import pandas as pd
+
+    df = pd.DataFrame(
+        rows,
+        columns=grn.species_names + ["input", "count", "basin_fraction", "restarts"],
+    )
+    df.attrs["stats"] = profiling.current()
 
     return df
 
 
+@profiling.instrumented
 def get_steady_single(
     grn,
     IN,
@@ -65,44 +282,33 @@ def get_steady_single(
     xlabel="time [a.u.]",
     ylabel="concentrations [a.u.]",
 ):
-    # read the model module
-
-    if type(model) is bool:
-        grn.generate_model()
-        model = "model"
-    if type(model) is str:
-        model_module = importlib.import_module(model.replace(os.sep, "."))
-        model_module = importlib.reload(model_module)
-        model = model_module.solve_model
-
     n_INS = len(grn.input_species_names)
     n_RS = len(grn.species_names) - n_INS
 
     X0 = np.array(IN) * INS_factor
 
-    if type(R0) is bool:
+    random_start = type(R0) is bool
+    if random_start:
         R0 = np.random.random(n_RS)
 
     S0 = np.append(X0, R0)
-    states = [S0]
 
-    t_step = 1
-    dt = 0.1
-    T = np.arange(0, t_step + dt, dt)
-
-    while True:
-        sol = solve_ivp(
-            model, [0, t_step], states[-1], dense_output=True, method="LSODA"
-        )  # gre za stiff problem, uporaba LSODA
-        z = sol.sol(T)
-        Y = z.T
-
-        if np.max(np.abs(Y[-2] - Y[-1])) < eps:
-            break
+    def compute():
+        # read the model module
+        return _steady_trajectory(_load_model(grn, model), S0, eps)
 
-        states.append(Y[-1])
+    if not random_start and _cacheable(grn, model):
+        # random initial states are never cached, they must not be frozen
+        states = cache.cached(
+            "steady_single", grn, compute, X0=X0, R0=S0[n_INS:], eps=eps
+        )
+    else:
+        states = compute()
+    states = list(states)
 
     if plot_on:
+        import matplotlib.pyplot as plt
+
         plt.plot(states)
         if legend:
             plt.legend(grn.species_names)
@@ -115,6 +321,7 @@ def get_steady_single(
     return states
 
 
+@profiling.instrumented
 def simulate_single(
     grn,
     IN,
@@ -127,14 +334,7 @@ def simulate_single(
     xlabel="time [a.u.]",
     ylabel="concentrations [a.u.]",
 ):
-    if type(model) is bool:
-        grn.generate_model()
-        model = "model"
-    if type(model) is str:
-        # read the model module
-        model_module = importlib.import_module(model.replace(os.sep, "."))
-        model_module = importlib.reload(model_module)
-        model = model_module.solve_model
+    model = _load_model(grn, model)
 
     n_INS = len(grn.input_species_names)
     n_RS = len(grn.species_names) - n_INS
@@ -145,14 +345,14 @@ def simulate_single(
 
     S0 = np.append(X0, R0)
 
-    sol = solve_ivp(
-        model, [0, t_end], S0, dense_output=True, method="LSODA"
-    )  # gre za stiff problem, uporaba LSODA
+    sol = solve(model, [0, t_end], S0)
     T = np.arange(0, t_end + 1)
     z = sol.sol(T)
     Y = z.T
 
     if plot_on:
+        import matplotlib.pyplot as plt
+
         plt.plot(T, Y)
         if legend:
             plt.legend(grn.species_names)
@@ -165,6 +365,7 @@ def simulate_single(
     return T, Y
 
 
+@profiling.instrumented
 def simulate_sequence(
     grn,
     IN_seq,
@@ -177,14 +378,7 @@ def simulate_sequence(
     ylabel="concentrations [a.u.]",
     ax: axes.Axes = None,
 ):
-    if type(model) is bool:
-        grn.generate_model()
-        model = "model"
-    if type(model) is str:
-        # read the model module
-        model_module = importlib.import_module(model.replace(os.sep, "."))
-        model_module = importlib.reload(model_module)
-        model = model_module.solve_model
+    model = _load_model(grn, model)
 
     n_INS = len(grn.input_species_names)
     n_RS = len(grn.species_names) - n_INS
@@ -215,6 +409,8 @@ def simulate_sequence(
             T = np.append(T, T1 + T[-1])
 
     if plot_on:
+        import matplotlib.pyplot as plt
+
         if ax is None:
             fig, new_ax = plt.subplots(1, 1, figsize=(12, 6))
         else:
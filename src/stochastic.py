@@ -0,0 +1,298 @@
+"""
+Stochastic simulation of GRN models: exact SSA (Gillespie) and tau-leaping.
+
+Every regulated species has two reactions, production with propensity
+omega * sum(alpha * up / down) evaluated at the concentrations x = N / omega,
+and degradation with propensity delta * N. Input species are held constant.
+Many independent realizations are simulated at once along a NumPy batch
+dimension and only summary statistics are kept, never full trajectories.
+"""
+
+import numpy as np
+from typing import Iterator, List, Literal, Optional, Tuple
+import src.profiling as profiling
+from src.grn import GRN
+from src.hill import HillTerms
+
+StochasticMethod = Literal["ssa", "tau"]
+
+
+class Summary:
+    """
+    Streaming summary of a set of realizations sampled on the time grid t.
+
+    Per time point the count, sum and sum of squares of every species are
+    accumulated, so summaries of separate batches can be merged. With a
+    switch species, the first switching time and number of switches of
+    every realization are kept as well.
+    """
+
+    def __init__(self, species_names: List[str], t: np.ndarray):
+        self.species_names = list(species_names)
+        self.t = t
+        self.n = 0
+        self.sum = np.zeros((len(t), len(species_names)))
+        self.sumsq = np.zeros((len(t), len(species_names)))
+        self.first_switch = np.empty(0)
+        self.n_switches = np.empty(0, dtype=np.int64)
+
+    @property
+    def mean(self) -> np.ndarray:
+        return self.sum / max(self.n, 1)
+
+    @property
+    def var(self) -> np.ndarray:
+        mean = self.mean
+        return np.maximum(self.sumsq / max(self.n, 1) - mean**2, 0)
+
+    @property
+    def switch_probability(self) -> float:
+        """Fraction of realizations that switched at least once"""
+        if len(self.first_switch) == 0:
+            return 0.0
+        return float(np.mean(np.isfinite(self.first_switch)))
+
+    @property
+    def mean_switch_time(self) -> float:
+        """Mean first switching time of the realizations that switched"""
+        switched = self.first_switch[np.isfinite(self.first_switch)]
+        return float(switched.mean()) if len(switched) else np.inf
+
+    @property
+    def switching_rate(self) -> float:
+        """Switches per unit time, averaged over all realizations"""
+        if self.n == 0:
+            return 0.0
+        return float(self.n_switches.sum() / (self.n * self.t[-1]))
+
+    def merge(self, other: "Summary") -> None:
+        self.n += other.n
+        self.sum += other.sum
+        self.sumsq += other.sumsq
+        self.first_switch = np.concatenate([self.first_switch, other.first_switch])
+        self.n_switches = np.concatenate([self.n_switches, other.n_switches])
+
+    def to_frame(self):
+        """Long-format DataFrame with time, species, mean and var"""
+        import pandas as pd
+
+        S = len(self.species_names)
+        return pd.DataFrame(
+            {
+                "time": np.repeat(self.t, S),
+                "species": np.tile(self.species_names, len(self.t)),
+                "mean": self.mean.ravel(),
+                "var": self.var.ravel(),
+            }
+        )
+
+
+class _Switch:
+    """Two-threshold switch detector on one species (concentrations)"""
+
+    def __init__(self, species: int, low: float, high: float, X0: np.ndarray):
+        self.species = species
+        self.low = low
+        self.high = high
+        self.state = X0[:, species] >= (low + high) / 2
+        self.first = np.full(len(X0), np.inf)
+        self.count = np.zeros(len(X0), dtype=np.int64)
+
+    def update(self, X: np.ndarray, t: np.ndarray) -> None:
+        x = X[:, self.species]
+        flipped = np.where(self.state, x <= self.low, x >= self.high)
+        if flipped.any():
+            self.state = self.state ^ flipped
+            self.count += flipped
+            self.first = np.where(flipped & np.isinf(self.first), t, self.first)
+
+
+def _propensities(hill: HillTerms, N: np.ndarray, omega: float, regulated):
+    X = N / omega
+    production = omega * hill.production(X)[:, regulated]
+    degradation = hill.delta[regulated] * N[:, regulated]
+    return production, degradation
+
+
+def _run_batch(
+    grn: GRN,
+    S0: np.ndarray,
+    n_runs: int,
+    t: np.ndarray,
+    method: StochasticMethod,
+    tau: float,
+    omega: float,
+    switch: Optional[Tuple[str, float, float]],
+    seed,
+) -> Summary:
+    rng = np.random.default_rng(seed)
+    hill = HillTerms(grn)
+    stats = profiling.current()
+
+    regulated = np.flatnonzero(~hill.index.is_input)
+    R = len(regulated)
+    # copy numbers; inputs are held constant and keep their exact scaled level
+    N = np.tile(S0 * omega, (n_runs, 1))
+    N[:, regulated] = np.round(N[:, regulated])
+
+    summary = Summary(grn.species_names, t)
+    summary.n = n_runs
+    detector = None
+    if switch is not None:
+        name, low, high = switch
+        detector = _Switch(grn.species_index[name], low, high, N / omega)
+
+    def record(rows, k):
+        # state of `rows` at sample time t[k]
+        X = N[rows] / omega
+        np.add.at(summary.sum, k, X)
+        np.add.at(summary.sumsq, k, X**2)
+
+    time = np.zeros(n_runs)
+    next_sample = np.zeros(n_runs, dtype=np.int64)
+    T = len(t)
+
+    if method == "tau":
+        record(np.arange(n_runs), next_sample)
+        next_sample += 1
+        while next_sample[0] < T:
+            production, degradation = _propensities(hill, N, omega, regulated)
+            N[:, regulated] += rng.poisson(production * tau)
+            N[:, regulated] -= rng.poisson(degradation * tau)
+            np.maximum(N, 0, out=N)
+            time += tau
+            if stats is not None:
+                stats.add("tau_leaps")
+            if detector is not None:
+                detector.update(N / omega, time)
+
+            # sample times passed in this leap
+            while next_sample[0] < T and t[next_sample[0]] <= time[0] + 1e-12:
+                record(np.arange(n_runs), next_sample)
+                next_sample += 1
+    elif method == "ssa":
+        active = np.arange(n_runs)
+        while len(active):
+            production, degradation = _propensities(hill, N[active], omega, regulated)
+            a = np.concatenate([production, degradation], axis=1)
+            a0 = a.sum(axis=1)
+            with np.errstate(divide="ignore"):
+                dt = rng.exponential(1.0, len(active)) / a0
+            t_new = time[active] + dt
+
+            # record every sample time skipped over by this jump
+            while True:
+                k = next_sample[active]
+                passed = (k < T) & (t[np.minimum(k, T - 1)] < t_new)
+                if not passed.any():
+                    break
+                rows = active[passed]
+                record(rows, next_sample[rows])
+                next_sample[rows] += 1
+
+            # fire one reaction in every realization still before the end
+            firing = next_sample[active] < T
+            if stats is not None:
+                stats.add("ssa_events", int(firing.sum()))
+            rows = active[firing]
+            cum = np.cumsum(a[firing], axis=1)
+            u = rng.random(len(rows)) * a0[firing]
+            reaction = (cum < u[:, None]).sum(axis=1)
+            reaction = np.minimum(reaction, 2 * R - 1)
+            produced = reaction < R
+            species = regulated[reaction % R]
+            N[rows, species] += np.where(produced, 1, -1)
+            time[rows] = t_new[firing]
+            if detector is not None:
+                detector.update(N / omega, time)
+
+            active = rows
+    else:
+        raise ValueError("Invalid method. Must be 'ssa' or 'tau'")
+
+    if detector is not None:
+        summary.first_switch = detector.first
+        summary.n_switches = detector.count
+
+    return summary
+
+
+def iter_stochastic(
+    grn: GRN,
+    IN,
+    n_runs: int = 1000,
+    t_end: float = 100,
+    dt: float = 1,
+    method: StochasticMethod = "ssa",
+    tau: float = 0.1,
+    INS_factor=1,
+    R0=None,
+    omega: float = 1.0,
+    switch: Optional[Tuple[str, float, float]] = None,
+    batch_size: int = 1000,
+    processes: Optional[int] = None,
+    seed=None,
+) -> Iterator[Summary]:
+    """
+    Run n_runs realizations in batches and yield the running Summary after
+    every finished batch.
+
+    Parameters:
+    IN: levels of the input species (concentrations), scaled by INS_factor
+    t_end, dt: the realizations are sampled at 0, dt, ..., t_end
+    method: "ssa" for the exact Gillespie algorithm, "tau" for tau-leaping
+    tau: leap size for tau-leaping, should divide dt
+    R0: initial concentrations of the regulated species, zeros by default
+    omega: system size, copy numbers are concentrations times omega
+    switch: (species, low, high), count transitions of species between
+        <= low and >= high and record first switching times
+    batch_size: realizations simulated together in one batch
+    processes: run batches in a process pool of this size
+    seed: seed for the random generator
+    """
+    n_INS = len(grn.input_species_names)
+    n_RS = len(grn.species_names) - n_INS
+
+    X0 = np.array(IN, dtype=float) * INS_factor
+    if R0 is None:
+        R0 = np.zeros(n_RS)
+    S0 = np.append(X0, R0)
+
+    t = np.arange(0, t_end + dt / 2, dt)
+    sizes = [batch_size] * (n_runs // batch_size)
+    if n_runs % batch_size:
+        sizes.append(n_runs % batch_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    args = [
+        (grn, S0, size, t, method, tau, omega, switch, s)
+        for size, s in zip(sizes, seeds)
+    ]
+
+    total = Summary(grn.species_names, t)
+
+    if processes is None or processes <= 1:
+        for a in args:
+            total.merge(_run_batch(*a))
+            yield total
+        return
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    with ProcessPoolExecutor(processes) as pool:
+        futures = [pool.submit(_run_batch, *a) for a in args]
+        for future in as_completed(futures):
+            total.merge(future.result())
+            yield total
+
+
+@profiling.instrumented
+def simulate_stochastic(grn: GRN, IN, **kwargs) -> Summary:
+    """
+    Run a stochastic simulation and return the final Summary.
+    See iter_stochastic for the parameters.
+    """
+    summary = None
+    for summary in iter_stochastic(grn, IN, **kwargs):
+        pass
+    return summary
@@ -0,0 +1,112 @@
+"""
+Compressed trajectories of deterministic (synchronous) simulations.
+
+Once a deterministic trajectory revisits a state it repeats the same cycle
+forever, so it is fully described by the transient before the cycle and one
+period of the cycle. Simulations stop at the first repeated state, detected by
+hashing integer-encoded states, and return a Trajectory that behaves like the
+full list of states and expands it only on demand.
+"""
+
+from collections.abc import Sequence
+from typing import Callable, Dict, List, TypeVar
+import src.profiling as profiling
+
+State = TypeVar("State", bound=dict)
+
+
+class Trajectory(Sequence):
+    """
+    Trajectory of `length` states: transient[0], ..., transient[-1], followed
+    by the cycle repeated until `length` states are reached. Indexing and
+    iteration give copies of the states, expand() gives the full list.
+    """
+
+    def __init__(self, transient: List[dict], cycle: List[dict], length: int):
+        self.transient = transient
+        self.cycle = cycle
+        self.length = length
+
+    @property
+    def period(self) -> int:
+        """Length of the cycle, 0 if none was reached"""
+        return len(self.cycle)
+
+    def __len__(self) -> int:
+        return self.length
+
+    def _state(self, i: int) -> dict:
+        if i < len(self.transient):
+            return self.transient[i]
+        return self.cycle[(i - len(self.transient)) % len(self.cycle)]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [dict(self._state(j)) for j in range(*i.indices(self.length))]
+        if i < 0:
+            i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError("trajectory index out of range")
+        return dict(self._state(i))
+
+    def __iter__(self):
+        for i in range(self.length):
+            yield dict(self._state(i))
+
+    def expand(self) -> List[dict]:
+        """The full list of states"""
+        return list(self)
+
+    def __eq__(self, other):
+        if isinstance(other, Sequence):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __add__(self, other):
+        return self.expand() + list(other)
+
+    def __radd__(self, other):
+        return list(other) + self.expand()
+
+    def __repr__(self):
+        return (
+            f"Trajectory(length={self.length}, transient={len(self.transient)}, "
+            f"period={self.period})"
+        )
+
+
+def encoder(names: List[str], radix: int = 2) -> Callable[[Dict], int]:
+    """Function encoding a state (dict over names) as one integer"""
+    weights = [radix**i for i in range(len(names))]
+
+    def encode(state: Dict) -> int:
+        return sum(int(state.get(name, 0)) * w for name, w in zip(names, weights))
+
+    return encode
+
+
+def simulate_deterministic(
+    step: Callable[[State], State],
+    initial_state: State,
+    steps: int,
+    encode: Callable[[State], int],
+) -> Trajectory:
+    """
+    Iterate step from initial_state for up to `steps` steps, stopping as soon
+    as a state repeats. The result has steps + 1 states, the cycle is only
+    stored once.
+    """
+    states = [initial_state]
+    seen = {encode(initial_state): 0}
+    for _ in range(steps):
+        next_state = step(states[-1])
+        code = encode(next_state)
+        first = seen.get(code)
+        if first is not None:
+            stats = profiling.current()
+            if stats is not None:
+                stats.add("steps_skipped", steps + 1 - len(states))
+            return Trajectory(states[:first], states[first:], steps + 1)
+        seen[code] = len(states)
+        states.append(next_state)
+    return Trajectory(states, [], len(states))
@@ -1,8 +1,12 @@
-import matplotlib.pyplot as plt
-from typing import List, Dict
-import networkx as nx
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, List, Dict
 import numpy as np
 
+# plotting backends are imported on first use, headless runs never pay for them
+if TYPE_CHECKING:
+    import networkx as nx
+
 
 def plot_trajectory(
     trajectory: List[Dict[str, bool]],
@@ -12,6 +16,8 @@ def plot_trajectory(
     ymin=None,
     ymax=None,
 ):
+    import matplotlib.pyplot as plt
+
     if ax is None:
         ax = plt.gca()
 
@@ -41,30 +47,220 @@ def print_attractors(attractors):
     print("Cyclic attractors:", attractors["cyclic_attractors"])
 
 
-def plot_state_transitions(G: nx.DiGraph, attractors, name_func=lambda x: x, ax=None):
-    node_colors = {n: "lightblue" for n in G.nodes}
-    for attr in attractors["steady_states"]:
-        node_colors[name_func(attr)] = "green"
+def condense_state_transitions(G: nx.DiGraph) -> nx.DiGraph:
+    """
+    Condense a state transition graph into attractors and basins.
+
+    Terminal strongly connected components of G are the attractors. All other
+    states are grouped by the set of attractors they can reach, so the result
+    has one node per attractor and one node per distinct basin region.
+
+    Node attributes:
+        kind: "steady", "cyclic" or "basin"
+        size: number of states in the node
+        states: list of the original states
+        basin_size: number of states that can reach the node's attractor(s)
+    """
+    import networkx as nx
+
+    C = nx.condensation(G)
+    members = nx.get_node_attributes(C, "members")
+
+    # attractors are SCCs without outgoing edges, each gets one bit
+    terminal = [c for c in C.nodes if C.out_degree(c) == 0]
+    bit = {c: 1 << i for i, c in enumerate(terminal)}
+
+    # set of reachable attractors per SCC, as a bitmask
+    reach = {}
+    for c in reversed(list(nx.topological_sort(C))):
+        if c in bit:
+            reach[c] = bit[c]
+        else:
+            mask = 0
+            for succ in C.successors(c):
+                mask |= reach[succ]
+            reach[c] = mask
+
+    def node_id(c):
+        return f"A{terminal.index(c)}" if c in bit else f"B{reach[c]}"
+
+    Q = nx.DiGraph()
+    for i, c in enumerate(terminal):
+        states = sorted(members[c])
+        Q.add_node(
+            f"A{i}",
+            kind="steady" if len(states) == 1 else "cyclic",
+            states=states,
+            size=len(states),
+            basin_size=0,
+        )
+
+    for c in C.nodes:
+        if c in bit:
+            continue
+        n = node_id(c)
+        if n not in Q:
+            Q.add_node(n, kind="basin", states=[], size=0, basin_size=0)
+        Q.nodes[n]["states"].extend(members[c])
+        Q.nodes[n]["size"] += len(members[c])
 
-    for attrs in attractors["cyclic_attractors"]:
-        for a in attrs:
-            node_colors[name_func(a)] = "red"
+    for u, v in C.edges:
+        nu, nv = node_id(u), node_id(v)
+        if nu != nv:
+            Q.add_edge(nu, nv)
+
+    for n, data in Q.nodes(data=True):
+        mask = int(n[1:]) if data["kind"] == "basin" else bit[terminal[int(n[1:])]]
+        for i, c in enumerate(terminal):
+            if mask & bit[c]:
+                Q.nodes[f"A{i}"]["basin_size"] += data["size"]
+
+    for n, data in Q.nodes(data=True):
+        if data["kind"] == "basin":
+            data["basin_size"] = data["size"]
+
+    return Q
+
+
+def sample_state_transitions(
+    G: nx.DiGraph, sample: int, keep=(), seed=None
+) -> nx.DiGraph:
+    """
+    Random induced subgraph of G with at most `sample` nodes.
+    Nodes in `keep` (e.g. attractor states) are always included.
+    """
+    rng = np.random.default_rng(seed)
+    keep = [n for n in keep if n in G]
+    rest = [n for n in G.nodes if n not in set(keep)]
+    k = max(0, min(len(rest), sample - len(keep)))
+    picked = [rest[i] for i in rng.choice(len(rest), size=k, replace=False)]
+    return G.subgraph(keep + picked).copy()
+
+
+def terminal_components(G: nx.DiGraph) -> List[List]:
+    """Terminal strongly connected components of G, the attractors of its dynamics"""
+    import networkx as nx
+
+    C = nx.condensation(G)
+    return [sorted(C.nodes[c]["members"]) for c in C.nodes if C.out_degree(c) == 0]
+
+
+def plot_state_transitions(
+    G: nx.DiGraph,
+    attractors=None,
+    name_func=lambda x: x,
+    ax=None,
+    condense=None,
+    max_nodes: int = 256,
+    sample: int | None = None,
+    seed=None,
+):
+    """
+    Plot a state transition graph.
+
+    Graphs with more than `max_nodes` states are condensed into attractors and
+    their basins (see condense_state_transitions), with node size scaled by
+    basin size. Pass condense=True/False to force either mode. With `sample`,
+    only a random subgraph of that many nodes (always including the
+    attractors) is drawn. Attractors and basins are always computed on the
+    full graph, so sampling does not create spurious attractors.
+
+    Both views highlight the terminal strongly connected components of G.
+    `attractors` (steady_states / cyclic_attractors, states mapped to nodes
+    with name_func) overrides them in the full view only.
+    """
+    import matplotlib.pyplot as plt
+    import networkx as nx
+
+    if condense is None:
+        condense = G.number_of_nodes() > max_nodes
 
     if ax is None:
         ax = plt.gca()
 
+    if condense:
+        _plot_condensed_state_transitions(G, ax, sample, seed)
+        return
+
+    if attractors is None:
+        components = terminal_components(G)
+        steady = [c[0] for c in components if len(c) == 1]
+        cyclic = [c for c in components if len(c) > 1]
+    else:
+        steady = [name_func(a) for a in attractors["steady_states"]]
+        cyclic = [
+            [name_func(a) for a in attrs] for attrs in attractors["cyclic_attractors"]
+        ]
+
+    if sample is not None and G.number_of_nodes() > sample:
+        attractor_states = steady + [n for attrs in cyclic for n in attrs]
+        G = sample_state_transitions(G, sample, attractor_states, seed)
+
+    node_colors = {n: "lightblue" for n in G.nodes}
+    for n in steady:
+        node_colors[n] = "green"
+
+    for attrs in cyclic:
+        for n in attrs:
+            node_colors[n] = "red"
+
     ax.set_title("State Transition Graph")
     nx.draw(
         G,
         with_labels=True,
         pos=nx.circular_layout(G),
         node_size=1000,
-        node_color=[node_colors[n] for n in G.nodes],
+        node_color=[node_colors.get(n, "lightblue") for n in G.nodes],
+        ax=ax,
+    )
+
+
+def _plot_condensed_state_transitions(
+    G: nx.DiGraph, ax, sample: int | None = None, seed=None
+):
+    import networkx as nx
+
+    Q = condense_state_transitions(G)
+    if sample is not None and Q.number_of_nodes() > sample:
+        # condensed first, sampling only restricts the basins that are drawn
+        attractor_nodes = [n for n, d in Q.nodes(data=True) if d["kind"] != "basin"]
+        Q = sample_state_transitions(Q, sample, attractor_nodes, seed)
+    colors = {"steady": "green", "cyclic": "red", "basin": "lightblue"}
+
+    # basins flow left to right into the attractors
+    for layer, nodes in enumerate(nx.topological_generations(Q)):
+        for n in nodes:
+            Q.nodes[n]["layer"] = layer
+    pos = nx.multipartite_layout(Q, subset_key="layer")
+
+    largest = max(d["basin_size"] for _, d in Q.nodes(data=True))
+    sizes = [300 + 2700 * d["basin_size"] / largest for _, d in Q.nodes(data=True)]
+
+    labels = {}
+    for n, d in Q.nodes(data=True):
+        if d["kind"] == "steady":
+            labels[n] = f"{d['states'][0]}\n({d['basin_size']})"
+        elif d["kind"] == "cyclic":
+            labels[n] = f"cycle of {d['size']}\n({d['basin_size']})"
+        else:
+            labels[n] = str(d["size"])
+
+    ax.set_title(f"State Transition Graph ({G.number_of_nodes()} states, condensed)")
+    nx.draw(
+        Q,
+        pos=pos,
+        labels=labels,
+        node_size=sizes,
+        node_color=[colors[d["kind"]] for _, d in Q.nodes(data=True)],
+        font_size=8,
         ax=ax,
     )
 
 
 def plot_interaction_graph(G: nx.DiGraph, ax=None):
+    import matplotlib.pyplot as plt
+    import networkx as nx
+
     if ax is None:
         ax = plt.gca()
 
@@ -0,0 +1,22 @@
+import json
+
+from src import batch
+
+
+def test_read_single_line_ndjson(tmp_path):
+    job = {"id": "toggle", "network": {"random": {"n_species": 3}}}
+    path = tmp_path / "jobs.ndjson"
+    path.write_text(json.dumps(job) + "\n")
+
+    assert batch.read_jobs(str(path)) == [job]
+
+
+def test_read_ndjson(tmp_path):
+    jobs = [{"analysis": "steady"}, {"analysis": "attractors"}]
+    path = tmp_path / "jobs.ndjson"
+    path.write_text("\n".join(json.dumps(job) for job in jobs) + "\n")
+
+    assert [job["id"] for job in batch.read_jobs(str(path))] == [
+        "job-000000",
+        "job-000001",
+    ]
@@ -0,0 +1,29 @@
+from src import cache
+from src.network_builder import Builder
+
+
+def network():
+    b = Builder()
+    X = b.species("X1")
+    A = b.species("A", 0.5)
+    b.gene([X.activates(1, 1)], [A], alpha=5)
+    return b.grn
+
+
+def test_hash_follows_direct_edits():
+    grn = network()
+    before = cache.grn_hash(grn)
+    grn.genes[0]["alpha"] = 50
+    assert cache.grn_hash(grn) != before
+    assert grn.index.alpha[0] == 50
+
+
+def test_corrupt_entry_is_a_miss(tmp_path):
+    results = cache.ResultCache(tmp_path)
+    results.put("key", [1, 2, 3])
+    assert results.get("key") == [1, 2, 3]
+
+    path = tmp_path / "key.bin"
+    path.write_bytes(cache._MAGIC + b"not zlib")
+    assert results.get("key", "missing") == "missing"
+    assert not path.exists()
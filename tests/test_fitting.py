@@ -0,0 +1,56 @@
+import numpy as np
+
+from src import fitting, sensitivity
+from src.network_builder import Builder
+
+
+def cascade(alpha=(5.0, 4.0), Kd=(2.0, 3.0), n=(2.0, 1.5)):
+    """X1 -> A -| B"""
+    b = Builder()
+    X = b.species("X1")
+    A = b.species("A", 0.5)
+    B = b.species("B", 0.5)
+    b.gene([X.activates(Kd[0], n[0])], [A], alpha=alpha[0])
+    b.gene([A.represses(Kd[1], n[1])], [B], alpha=alpha[1])
+    return b.grn
+
+
+def test_recovers_parameters():
+    true = cascade()
+    T = np.arange(0, 21, 2.0)
+    R0 = np.array([0.0, 1.0])
+    experiments = []
+    # the X1 = 0 course keeps A at 0, where n < 1 used to give NaN gradients
+    for IN in ([0.0], [1.0], [2.5], [6.0]):
+        _, Y, _, _ = sensitivity.simulate_sensitivity(
+            true, IN, parameters=(), t_end=20, R0=R0, rtol=1e-10, atol=1e-12
+        )
+        experiments.append(
+            {
+                "IN": IN,
+                "T": T,
+                "species": ["A", "B"],
+                "Y": Y[T.astype(int), 1:],
+                "R0": R0,
+            }
+        )
+
+    kinds = ("alpha", "Kd", "n")
+    results = fitting.fit(
+        cascade(alpha=(3.0, 6.0), Kd=(1.0, 5.0), n=(1.0, 1.0)),
+        experiments,
+        parameters=kinds,
+        n_starts=1,
+        seed=0,
+    )
+    best = results[0]
+    assert best["success"]
+    assert best["loss"] < 1e-6
+    np.testing.assert_allclose(
+        best["parameters"]["fitted"],
+        sensitivity.parameter_values(true, kinds),
+        rtol=1e-2,
+    )
+    # starts are never reported successful at a non-finite loss
+    for r in results:
+        assert np.isfinite(r["loss"]) or not r["success"]
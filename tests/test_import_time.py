@@ -0,0 +1,59 @@
+"""
+Importing the simulation core must stay fast: plotting and heavy optional
+backends are imported lazily, inside the functions that use them.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY = ("matplotlib", "pandas", "scipy", "networkx", "pyboolnet")
+MODULES = (
+    "src.grn",
+    "src.hill",
+    "src.simulator",
+    "src.ode_model",
+    "src.bool_sim",
+    "src.batch",
+)
+
+# seconds, generous compared to the ~0.15s measured without the heavy stacks
+MAX_IMPORT_TIME = 1.0
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(json.dumps({{"seconds": seconds, "heavy": heavy}}))
+"""
+
+
+def _import(module: str) -> dict:
+    # fresh interpreter per module, nothing is imported yet
+    out = subprocess.run(
+        [sys.executable, "-c", SCRIPT.format(module=module, heavy=HEAVY)],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+@pytest.mark.parametrize("module", MODULES)
+def test_no_heavy_imports(module):
+    assert _import(module)["heavy"] == []
+
+
+@pytest.mark.parametrize("module", MODULES)
+def test_import_time(module):
+    # best of three, against a cold file cache on the first run
+    seconds = min(_import(module)["seconds"] for _ in range(3))
+    assert seconds < MAX_IMPORT_TIME
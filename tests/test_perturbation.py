@@ -0,0 +1,22 @@
+from src import perturbation
+from src.network_builder import Builder
+
+
+def test_multistable_states_per_input():
+    # toggle switch A -| B -| A, the input X1 represses B
+    b = Builder()
+    X = b.species("X1")
+    A = b.species("A", 1)
+    B = b.species("B", 1)
+    b.gene([B.represses(1, 2)], [A], alpha=5)
+    b.gene([A.represses(1, 2), X.represses(1, 2)], [B], alpha=5)
+
+    df = perturbation.screen(b.grn, perturbations=[()], INS_factor=10, seed=0)
+    counts = df.groupby(["engine", "input"]).size().to_dict()
+    # both engines find both states without the input and one state with it
+    assert counts == {
+        ("boolean", "0"): 2,
+        ("boolean", "1"): 1,
+        ("ode", "0"): 2,
+        ("ode", "1"): 1,
+    }
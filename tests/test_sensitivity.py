@@ -0,0 +1,21 @@
+import numpy as np
+
+from src import sensitivity
+from src.network_builder import Builder
+
+
+def test_hill_exponent_below_one_at_zero():
+    # x ** (n - 1) is infinite at x = 0 for n < 1, the sensitivities must
+    # stay finite when the regulator sits at 0
+    b = Builder()
+    X = b.species("X1")
+    A = b.species("A", 0.5)
+    B = b.species("B", 0.5)
+    b.gene([X.activates(2, 0.8)], [A], alpha=5)
+    b.gene([A.represses(3, 0.8)], [B], alpha=5)
+
+    T, Y, dY, names = sensitivity.simulate_sensitivity(
+        b.grn, [0], t_end=20, R0=np.array([0.0, 1.0])
+    )
+    assert np.isfinite(Y).all()
+    assert np.isfinite(dY).all()
@@ -0,0 +1,21 @@
+import numpy as np
+
+from src import stochastic
+from src.network_builder import Builder
+
+
+def test_inputs_are_not_rounded():
+    # at omega = 1 an input level of 0.4 must not be rounded to 0 copies
+    b = Builder()
+    IN = b.species("IN")
+    A = b.species("A", 1.0)
+    b.gene([IN.activates(1, 1)], [A], alpha=5)
+
+    for method in ("ssa", "tau"):
+        summary = stochastic.simulate_stochastic(
+            b.grn, [0.4], n_runs=2000, t_end=20, omega=1, method=method, seed=0
+        )
+        mean = summary.mean[-1]
+        np.testing.assert_allclose(mean[0], 0.4)
+        # Poisson steady state with mean alpha * IN / (Kd + IN) / delta
+        np.testing.assert_allclose(mean[1], 5 * 0.4 / 1.4, rtol=0.1)